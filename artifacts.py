@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import time
+
+
+OUT_DIR = './out'
+MANIFEST = 'manifest.json'
+
+# bump when barh() output changes for the same input
+RENDER_VERSION = 2
+
+# image formats drawn by barh() by default, with their dpi
+IMAGES = {'png': 300}
+
+
+def job_hash(frame, options):
+    # content address of a chart: the aggregated frame and every
+    # rendering argument
+    h = hashlib.sha1()
+    h.update(str(RENDER_VERSION).encode('UTF-8'))
+    h.update(frame.to_csv().encode('UTF-8'))
+    h.update(repr(sorted(options.items())).encode('UTF-8'))
+    return h.hexdigest()
+
+
+def job_files(options):
+    filename = options.get('filename', 'figure.png')
+    return [filename + '.' + fmt
+            for fmt in sorted(options.get('images') or IMAGES)]
+
+
+def load_manifest(out_dir=OUT_DIR):
+    path = os.path.join(out_dir, MANIFEST)
+    if (not os.path.exists(path)):
+        return {}
+    with open(path, encoding='UTF-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, out_dir=OUT_DIR):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + '.tmp', 'w', encoding='UTF-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def is_fresh(manifest, job, out_dir=OUT_DIR):
+    # an identical chart has already been written and is still there
+    frame, options = job
+    entry = manifest.get(options.get('filename'))
+    return (entry is not None and
+            entry['hash'] == job_hash(frame, options) and
+            all(os.path.exists(os.path.join(out_dir, name))
+                for name in entry['files']))
+
+
+def record(manifest, job):
+    frame, options = job
+    manifest[options.get('filename')] = {
+        'hash': job_hash(frame, options),
+        'files': job_files(options),
+        'used': time.time()
+    }
+
+
+def clean_outputs(max_age_days=30, out_dir=OUT_DIR):
+    # drop artifacts that no run has asked for in max_age_days, in
+    # out_dir and in the partition directories below it
+    limit = time.time() - max_age_days * 24 * 3600
+    for root, dirs, files in os.walk(out_dir):
+        if (MANIFEST not in files):
+            continue
+        manifest = load_manifest(root)
+        for name, entry in list(manifest.items()):
+            if (entry['used'] < limit):
+                for filename in entry['files']:
+                    path = os.path.join(root, filename)
+                    if (os.path.exists(path)):
+                        os.remove(path)
+                        print('Removed %s' % path)
+                del manifest[name]
+        save_manifest(manifest, root)
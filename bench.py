@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset import load_stents
+from outputs import write_tables
+from report import barh, render_all, setup_matplotlib
+from schema import read_fields
+from tasks import build_charts, compute, new_run, task_tables
+
+
+# Benchmark of the report pipeline on synthetic exports of growing size.
+# Every scale runs in its own scratch directory with in/ and out/, so
+# the real report outputs are never touched.
+
+
+def empirical(path='./in/st.csv'):
+    # value distributions of the real export: card level columns are
+    # counted once per patient, stent columns once per stent
+    real = pd.read_csv(path, encoding='UTF-8', dtype=object)
+    people = real.drop_duplicates('patient_id')
+    distributions = {}
+    for name in real.columns:
+        source = real if name.startswith('stents.') else people
+        counts = source[name].fillna('').value_counts()
+        distributions[name] = (counts.index.values,
+                               counts.values / float(counts.sum()))
+    per_patient = real.groupby('patient_id').size().values
+    return distributions, per_patient
+
+
+def generate(path, rows, distributions, per_patient, seed=0,
+             chunk_patients=50000):
+    # seeded synthetic export with the fields.txt layout, written in
+    # chunks so that large scales do not need to fit in memory
+    rng = np.random.RandomState(seed)
+    fields = read_fields()
+    written = 0
+    patient = 0
+    with open(path, 'w', encoding='UTF-8', newline='') as f:
+        while (written < rows):
+            counts = rng.choice(per_patient, chunk_patients)
+            counts = counts[:np.searchsorted(np.cumsum(counts),
+                                             rows - written) + 1]
+            n = len(counts)
+            total = int(counts.sum())
+            data = {}
+            for name in fields:
+                values, p = distributions[name]
+                if (name.startswith('stents.')):
+                    data[name] = values[rng.choice(len(values), total, p=p)]
+                else:
+                    data[name] = np.repeat(
+                        values[rng.choice(len(values), n, p=p)], counts)
+            data['patient_id'] = np.repeat(
+                ['syn%014d' % i for i in range(patient, patient + n)], counts)
+            data['stents._id'] = ['syn%014d' % i
+                                  for i in range(written, written + total)]
+            frame = pd.DataFrame(data, columns=fields)[:rows - written]
+            frame.to_csv(f, header=(written == 0), index=False)
+            written += len(frame)
+            patient += n
+    return written
+
+
+def timed(results, stage, function, *args, **kwargs):
+    started = time.time()
+    value = function(*args, **kwargs)
+    results[stage] = round(time.time() - started, 4)
+    return value
+
+
+def bench_scale(rows, distributions, per_patient, seed, workers):
+    results = {'rows': rows}
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='stents-bench-')
+    try:
+        os.makedirs(os.path.join(workdir, 'in'))
+        os.makedirs(os.path.join(workdir, 'out'))
+        shutil.copy('./in/fields.txt', os.path.join(workdir, 'in'))
+        os.chdir(workdir)
+
+        timed(results, 'generate', generate, './in/st.csv', rows,
+              distributions, per_patient, seed)
+        # the first load parses the csv and builds the typed cache
+        timed(results, 'load_cold', load_stents)
+        run = new_run()
+        timed(results, 'load', compute, run, 'stents')
+        people = timed(results, 'dedup', compute, run, 'people')
+        results['patients'] = len(people)
+
+        def aggregation():
+            for name in ('stents_cube', 'people_cube', 'mean_age',
+                         'stent_size'):
+                compute(run, name)
+        timed(results, 'aggregation', aggregation)
+        timed(results, 'correlation', compute, run, 'correlations')
+        charts = timed(results, 'charts', build_charts, run)
+        # barh() draws the png of every chart
+        timed(results, 'render', render_all, charts, workers, cache=False)
+        # one workbook with the tables of all tasks
+        timed(results, 'excel', write_tables, task_tables(run, charts))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+    results['total'] = round(sum(v for k, v in results.items()
+                                 if k not in ('rows', 'patients')), 4)
+    return results
+
+
+def bench_labels(categories, seed=0, repeats=3):
+    # render time of a single chart with many bars, e.g. every diagnosis
+    # without dataslice; the best of a few runs
+    rng = np.random.RandomState(seed)
+    index = ['category %d' % i for i in range(categories)]
+    charts = {
+        'basic': (pd.Series(rng.randint(0, 1000, categories), index=index),
+                  dict(color='m')),
+        'stacked': (pd.DataFrame(rng.randint(0, 500, (categories, 2)),
+                                 index=index, columns=['a', 'b']),
+                    dict(color='bg', stacked=True, legend=True)),
+    }
+    results = {'categories': categories}
+    workdir = tempfile.mkdtemp(prefix='stents-bench-')
+    try:
+        for name, (frame, options) in sorted(charts.items()):
+            best = None
+            for i in range(repeats):
+                started = time.time()
+                barh(frame, figsize=(8, max(6, categories / 8.0)),
+                     filename=name, out_dir=workdir, **options)
+                elapsed = time.time() - started
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = round(best, 4)
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the report on synthetic data')
+    parser.add_argument('--scales', default='10000,100000,1000000',
+                        help='comma separated numbers of stents')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--labels', default=None,
+                        help='only time single charts with these comma '
+                             'separated numbers of bars')
+    parser.add_argument('--out', default='./bench.json',
+                        help='machine-readable results')
+    args = parser.parse_args()
+
+    setup_matplotlib()
+    runs = []
+    if (args.labels):
+        for categories in [int(n) for n in args.labels.split(',')]:
+            results = bench_labels(categories, args.seed)
+            print(' '.join('%s=%s' % item for item in sorted(results.items())))
+            runs.append(results)
+    else:
+        distributions, per_patient = empirical()
+        for rows in [int(scale) for scale in args.scales.split(',')]:
+            results = bench_scale(rows, distributions, per_patient,
+                                  args.seed, args.workers)
+            print(' '.join('%s=%s' % item
+                           for item in sorted(results.items())))
+            runs.append(results)
+
+    with open(args.out, 'w', encoding='UTF-8') as f:
+        json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'pandas': pd.__version__,
+                   'seed': args.seed,
+                   'workers': args.workers,
+                   'runs': runs}, f, indent=1)
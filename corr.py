@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+
+from schema import DTYPES
+
+
+CORR_TASKS = {
+    'task8': ['hospitalization.diagnosis',
+              'stents.segmentNo',
+              'stents.tortuosityDeg',
+              'stents.calcificationDeg'],
+    'task13': ['stents.stent.len',
+               'stents.stent.dia',
+               'stents.segmentNo',
+               'stents.stenosisType',
+               'stents.tortuosityDeg',
+               'stents.calcificationDeg'],
+    'task14': ['patient.sex',
+               'patient.age',
+               'hospitalization.diagnosis',
+               'stents.stenosisType',
+               'stents.segmentNo',
+               'stents.tortuosityDeg',
+               'stents.calcificationDeg',
+               'stents.hResults.success',
+               'stents.hResults.replaced',
+               'stents.predilatation',
+               'stents.postdilatation',
+               'stents.stent.type'],
+}
+# task 15 is task 14 plus the long-term complications
+CORR_TASKS['task15'] = ['stents.rResults.problems'] + CORR_TASKS['task14']
+
+# relative size below which a variance is taken for rounding noise
+VARIANCE_TOLERANCE = 1e-10
+
+CORR_NAMES = {
+    'stents.rResults.problems': 'Отд. осложнения',
+    'patient.sex': 'Пол',
+    'patient.age': 'Возраст',
+    'hospitalization.diagnosis': 'Диагноз',
+    'stents.stent.len': 'Длина стента',
+    'stents.stent.dia': 'Диаметр стента',
+    'stents.stenosisType': 'Тип стеноза',
+    'stents.segmentNo': 'Номер сегмента',
+    'stents.tortuosityDeg': 'Извитость',
+    'stents.calcificationDeg': 'Кальциноз',
+    'stents.hResults.success': 'Процедура успешна',
+    'stents.hResults.replaced': 'Замена стента',
+    'stents.predilatation': 'Предилятация',
+    'stents.postdilatation': 'Постдилятация',
+    'stents.stent.type': 'Тип стента'
+}
+
+
+def corr_columns(tasks=None):
+    # union of the columns needed by the given correlation tasks
+    columns = []
+    for task in sorted(CORR_TASKS) if tasks is None else tasks:
+        for column in CORR_TASKS[task]:
+            if (column not in columns):
+                columns.append(column)
+    return columns
+
+
+def is_categorical(column):
+    return DTYPES[column] == 'category'
+
+
+def encode(stents, columns):
+    # Replace strings with category codes, once for all tasks.
+    # Missing values become NaN instead of a code of their own.
+    matrix = np.empty((len(stents), len(columns)), dtype=np.float64)
+    levels = {}
+    for i, column in enumerate(columns):
+        values = stents[column]
+        if (is_categorical(column)):
+            categorical = pd.Categorical(values)
+            codes = np.asarray(categorical.codes)
+            matrix[:, i] = np.where(codes < 0, np.nan, codes)
+            levels[column] = len(categorical.categories)
+        else:
+            matrix[:, i] = np.asarray(values, dtype=np.float64)
+    return matrix, levels
+
+
+def pairwise_corr(matrix):
+    # Pearson correlation over pairwise complete observations, the same
+    # as DataFrame.corr(), for all column pairs in a few matrix products
+    mask = ~np.isnan(matrix)
+    m = mask.astype(np.float64)
+    # centering does not change the correlation but keeps sums small
+    centered = np.where(mask, matrix - np.nanmean(matrix, axis=0), 0.0)
+    n = m.T.dot(m)
+    sx = centered.T.dot(m)
+    sxx = (centered ** 2).T.dot(m)
+    sxy = centered.T.dot(centered)
+    spread = n * sxx - sx ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = n * sxy - sx * sx.T
+        corr = cov / np.sqrt(spread * spread.T)
+    # a column that is constant on the rows it shares with another one
+    # has no variance there, but rounding leaves a tiny residue instead
+    # of 0; DataFrame.corr() gives NaN for such pairs
+    flat = spread <= VARIANCE_TOLERANCE * n * sxx
+    corr[flat | flat.T | (n < 2)] = np.nan
+    return corr
+
+
+def contingency(x, y, x_levels, y_levels):
+    both = ~(np.isnan(x) | np.isnan(y))
+    key = x[both].astype(np.int64) * y_levels + y[both].astype(np.int64)
+    table = np.bincount(key, minlength=x_levels * y_levels)
+    return table.reshape(x_levels, y_levels).astype(np.float64)
+
+
+def cramers_v(table):
+    # drop empty rows and columns before measuring association
+    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+    n = table.sum()
+    k = min(table.shape) - 1
+    if (n == 0 or k < 1):
+        return np.nan
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / n
+    chi2 = ((table - expected) ** 2 / expected).sum()
+    return np.sqrt(chi2 / n / k)
+
+
+def correlation_ratio(codes, values, levels):
+    # eta: share of the variance of values explained by the categories
+    both = ~(np.isnan(codes) | np.isnan(values))
+    codes = codes[both].astype(np.int64)
+    values = values[both]
+    if (len(values) == 0):
+        return np.nan
+    counts = np.bincount(codes, minlength=levels)
+    sums = np.bincount(codes, weights=values, minlength=levels)
+    mean = values.mean()
+    total = ((values - mean) ** 2).sum()
+    if (total == 0):
+        return np.nan
+    present = counts > 0
+    between = (counts[present] *
+               (sums[present] / counts[present] - mean) ** 2).sum()
+    return np.sqrt(between / total)
+
+
+def association(matrix, columns, levels):
+    # Cramer's V for pairs of categories, the correlation ratio for a
+    # category against a number and |Pearson r| for two numbers
+    k = len(columns)
+    result = np.abs(pairwise_corr(matrix))
+    for i in range(k):
+        for j in range(i, k):
+            a, b = columns[i], columns[j]
+            if (a in levels and b in levels):
+                value = cramers_v(contingency(matrix[:, i], matrix[:, j],
+                                              levels[a], levels[b]))
+            elif (a in levels):
+                value = correlation_ratio(matrix[:, i], matrix[:, j],
+                                          levels[a])
+            elif (b in levels):
+                value = correlation_ratio(matrix[:, j], matrix[:, i],
+                                          levels[b])
+            else:
+                continue
+            result[i, j] = result[j, i] = value
+    return result
+
+
+def build_correlations(stents, tasks=None):
+    # encode the union of the columns of all tasks once and compute a
+    # single matrix of each kind; tasks take their sub-matrices
+    columns = corr_columns(tasks)
+    matrix, levels = encode(stents, columns)
+    return {'columns': columns,
+            'corr': pairwise_corr(matrix),
+            'assoc': association(matrix, columns, levels)}
+
+
+def task_matrix(correlations, task, kind='corr'):
+    index = [correlations['columns'].index(c) for c in CORR_TASKS[task]]
+    names = [CORR_NAMES[c] for c in CORR_TASKS[task]]
+    values = correlations[kind][np.ix_(index, index)]
+    return pd.DataFrame(values, index=names, columns=names)
+
+
+def corr_tables(correlations, task):
+    # sheets of a correlation task: Pearson r and the association
+    # measures
+    return [(task, task_matrix(correlations, task)),
+            (task + '_assoc', task_matrix(correlations, task, 'assoc'))]
+
+
+def print_mean_stent_size(mean_len, mean_dia):
+    print('Средняя длина стента:   %.2f мм' % mean_len)
+    print('Средний диаметр стента: %.2f мм\n' % mean_dia)
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+
+# categorical dimensions used by the count charts
+STENT_DIMS = ['hospitalization.diagnosis',
+              'patient.sex',
+              'stents.segmentNo',
+              'stents.stenosisType',
+              'stents.tortuosityDeg',
+              'stents.hResults.success',
+              'stents.hResults.replaced',
+              'stents.predilatation',
+              'stents.postdilatation',
+              'stents.stent.type']
+
+PEOPLE_DIMS = ['patient.sex',
+               'impressions.conductance',
+               'impressions.conformability',
+               'impressions.delivery',
+               'impressions.flexibility',
+               'impressions.recoil',
+               'impressions.overall']
+
+
+def build_cube(frame, dims):
+    # Sparse count cube over the given columns, built in one pass:
+    # every row gets a mixed-radix key from its integer codes and the
+    # distinct keys are counted. Missing values get a level of their
+    # own so that they still count towards the other dimensions.
+    levels = []
+    sizes = []
+    key = np.zeros(len(frame), dtype=np.int64)
+    for dim in dims:
+        column = frame[dim]
+        if (str(column.dtype) == 'category'):
+            codes = np.asarray(column.cat.codes)
+            uniques = np.asarray(column.cat.categories)
+        else:
+            codes, uniques = pd.factorize(column, sort=True)
+        codes = np.where(codes < 0, len(uniques), codes)
+        size = len(uniques) + 1
+        key = key * size + codes
+        levels.append(uniques)
+        sizes.append(size)
+    return cube_from_keys(dims, levels, sizes, key)
+
+
+def cube_from_keys(dims, levels, sizes, key, weights=None):
+    # count the distinct keys and decode them back into per-dimension
+    # codes
+    cells, inverse = np.unique(key, return_inverse=True)
+    counts = np.bincount(inverse, weights=weights).astype(np.int64)
+    coords = np.empty((len(dims), len(cells)), dtype=np.int64)
+    rest = cells
+    for i in range(len(dims) - 1, -1, -1):
+        coords[i] = rest % sizes[i]
+        rest = rest // sizes[i]
+    return {'dims': list(dims), 'levels': levels, 'sizes': sizes,
+            'coords': coords, 'counts': counts}
+
+
+def merge_cubes(a, b):
+    # sum of two cubes over the same dimensions, e.g. built from
+    # different chunks of the export
+    if (a is None):
+        return b
+    levels = []
+    sizes = []
+    keys = [np.zeros(len(a['counts']), dtype=np.int64),
+            np.zeros(len(b['counts']), dtype=np.int64)]
+    for i in range(len(a['dims'])):
+        union = np.union1d(a['levels'][i], b['levels'][i])
+        size = len(union) + 1
+        for j, cube in enumerate((a, b)):
+            # the missing level stays last
+            remap = np.append(np.searchsorted(union, cube['levels'][i]),
+                              len(union))
+            keys[j] = keys[j] * size + remap[cube['coords'][i]]
+        levels.append(union)
+        sizes.append(size)
+    return cube_from_keys(a['dims'], levels, sizes, np.concatenate(keys),
+                          np.concatenate([a['counts'], b['counts']]))
+
+
+def cube_counts(cube, groupby):
+    # counts for one or several dimensions, marginalized over the rest;
+    # same result as data.groupby(groupby).size()
+    if (isinstance(groupby, str)):
+        groupby = [groupby]
+    axes = [cube['dims'].index(dim) for dim in groupby]
+
+    # cells with a missing value in any requested dimension are dropped,
+    # like groupby does
+    observed = np.ones(len(cube['counts']), dtype=bool)
+    key = np.zeros(len(cube['counts']), dtype=np.int64)
+    shape = []
+    for axis in axes:
+        size = len(cube['levels'][axis])
+        observed &= cube['coords'][axis] < size
+        key = key * size + cube['coords'][axis]
+        shape.append(size)
+    total = int(np.prod(shape))
+    counts = np.bincount(key[observed], weights=cube['counts'][observed],
+                         minlength=total).astype(np.int64)
+
+    if (len(axes) == 1):
+        index = pd.Index(cube['levels'][axes[0]], name=groupby[0])
+    else:
+        index = pd.MultiIndex.from_product(
+            [cube['levels'][axis] for axis in axes], names=groupby)
+    series = pd.Series(counts, index=index)
+    return series[series > 0]
+
+
+def cube_value_counts(cube, column):
+    # same result as data[column].value_counts()
+    series = cube_counts(cube, column)
+    series = series.sort_values(ascending=False)
+    series.index.name = None
+    series.name = None
+    return series
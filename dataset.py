@@ -0,0 +1,227 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from export import export_pipeline, export_rows
+from schema import DTYPES, SCHEMA, check_fields, columns_for, \
+    peak_rss_mb, read_fields, stored_columns
+
+
+CACHE_DIR = './in/.cache'
+# bump when encode_column() or the cache layout changes
+CACHE_VERSION = 1
+
+
+def file_key(path):
+    # cache key: content hash plus size of the source file, the cache
+    # format and the schema it was encoded with
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    schema = hashlib.sha1(repr(SCHEMA).encode('UTF-8')).hexdigest()
+    return '%s-%d-v%d-%s' % (h.hexdigest(), os.path.getsize(path),
+                             CACHE_VERSION, schema[:12])
+
+
+def drop_stale_caches(cache_dir, keep):
+    # caches of earlier exports or schemas are never read again
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if (name != keep and not name.endswith('.tmp') and
+                os.path.isdir(path)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def smallest_int(low, high):
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if (info.min <= low and high <= info.max):
+            return dtype
+    return np.int64
+
+
+def parse_dates(series, fmt='%d.%m.%Y'):
+    # Dates of the export are fixed-format strings with few distinct
+    # values: every distinct string is parsed once and the rows take
+    # their parsed value by code. Unparseable strings become NaT.
+    codes, uniques = pd.factorize(np.asarray(series, dtype=object))
+    dates = pd.to_datetime(pd.Series(uniques, dtype=object), format=fmt,
+                           errors='coerce')
+    # code -1 (missing) picks the NaT appended at the end
+    dates = np.append(np.asarray(dates, dtype='datetime64[ns]'),
+                      np.datetime64('NaT', 'ns'))
+    return dates[codes]
+
+
+def encode_column(series, dtype):
+    # returns (kind, array, extra meta) for a parsed csv column, using
+    # the smallest dtype that holds it
+    if (dtype == 'date'):
+        return 'date', parse_dates(series).view('i8'), {}
+    if (dtype == 'bool'):
+        values = series.astype(str).str.lower() == 'true'
+        return 'bool', values.values, {}
+    if (dtype.startswith('int')):
+        values = series.values.astype(np.float64)
+        if (not np.isnan(values).any()):
+            if (len(values)):
+                return 'int', values.astype(
+                    smallest_int(values.min(), values.max())), {}
+            return 'int', values.astype(dtype), {}
+        # missing values: keep them as NaN
+        return 'float', values.astype(np.float32), {}
+    if (dtype.startswith('float')):
+        return 'float', series.values.astype(dtype), {}
+    categorical = pd.Categorical(series)
+    categories = [str(c) for c in categorical.categories]
+    codes = np.asarray(categorical.codes)
+    codes = codes.astype(smallest_int(-1, len(categories)))
+    return 'category', codes, {'categories': categories}
+
+
+def decode_column(kind, values, meta):
+    if (kind == 'category'):
+        return pd.Categorical.from_codes(values, meta['categories'])
+    if (kind == 'date'):
+        return values.view('datetime64[ns]')
+    return values
+
+
+def write_cache(frame, cache_path):
+    tmp = cache_path + '.tmp'
+    os.makedirs(tmp, exist_ok=True)
+    columns = []
+    for i, name in enumerate(frame.columns):
+        kind, values, meta = encode_column(frame[name], DTYPES[name])
+        filename = '%03d.npy' % i
+        np.save(os.path.join(tmp, filename), np.ascontiguousarray(values))
+        columns.append(dict(meta, name=name, kind=kind, file=filename))
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='UTF-8') as f:
+        json.dump({'columns': columns, 'rows': len(frame)}, f,
+                  ensure_ascii=False)
+    os.rename(tmp, cache_path)
+
+
+def read_cache(cache_path, columns):
+    with open(os.path.join(cache_path, 'meta.json'), encoding='UTF-8') as f:
+        meta = json.load(f)
+    data = {}
+    for column in meta['columns']:
+        if (column['name'] not in columns):
+            continue
+        values = np.load(os.path.join(cache_path, column['file']),
+                         mmap_mode='r')
+        data[column['name']] = decode_column(column['kind'], values, column)
+    missing = [name for name in columns if name not in data]
+    if (missing):
+        raise KeyError('%s is not cached in %s' % (', '.join(missing),
+                                                   cache_path))
+    return pd.DataFrame(data, columns=columns)
+
+
+def read_projected_csv(path, columns):
+    # parse only the requested columns; free text and categories stay
+    # strings until they are encoded
+    dtype = dict((name, object) for name in columns
+                 if DTYPES[name] in ('text', 'category', 'bool', 'date'))
+    frame = pd.read_csv(path, encoding='UTF-8', sep=',', usecols=columns,
+                        dtype=dtype)
+    return frame[columns]
+
+
+def apply_dtypes(frame):
+    # narrow floats and parse dates the same way the cache does, so that
+    # statistics over chunks see the same values as statistics over the
+    # cached table
+    for name in frame.columns:
+        if (DTYPES[name].startswith('float')):
+            frame[name] = frame[name].astype(DTYPES[name])
+        elif (DTYPES[name] == 'date'):
+            frame[name] = parse_dates(frame[name])
+    return frame
+
+
+def read_chunks(path='./in/st.csv', columns=None, chunksize=100000):
+    # the export as a sequence of projected frames of chunksize rows
+    if (columns is None):
+        columns = columns_for()
+    if ('patient_id' not in columns):
+        columns = ['patient_id'] + list(columns)
+    dtype = dict((name, object) for name in columns
+                 if DTYPES[name] in ('text', 'category', 'bool', 'date'))
+    reader = pd.read_csv(path, encoding='UTF-8', sep=',', usecols=columns,
+                         dtype=dtype, chunksize=chunksize)
+    for frame in reader:
+        yield apply_dtypes(frame[columns]).set_index('patient_id')
+
+
+def row_chunks(rows, fields, columns=None, chunksize=100000):
+    # same as read_chunks() for csv rows coming from another source,
+    # e.g. export.export_rows() over a Mongo cursor
+    buffer = None
+    count = 0
+    for row in rows:
+        if (buffer is None):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+        writer.writerow(row)
+        count += 1
+        if (count == chunksize):
+            buffer.seek(0)
+            for frame in read_chunks(buffer, columns, chunksize):
+                yield frame
+            buffer = None
+            count = 0
+    if (buffer is not None):
+        buffer.seek(0)
+        for frame in read_chunks(buffer, columns, chunksize):
+            yield frame
+
+
+def mongo_chunks(url='mongodb://localhost:27017/', columns=None,
+                 chunksize=100000):
+    # stream the unwound cards straight from the database
+    from pymongo import MongoClient
+    fields = read_fields()
+    cards = MongoClient(url).stents.cards
+    cursor = cards.aggregate(export_pipeline(fields), allowDiskUse=True,
+                             batchSize=1000)
+    return row_chunks(export_rows(cursor, fields), fields, columns, chunksize)
+
+
+def load_stents(path='./in/st.csv', columns=None, cache_dir=CACHE_DIR,
+                verbose=False):
+    # typed, memory-mapped copy of the csv export, projected to the
+    # columns used by the report; the csv is only parsed when its
+    # contents change
+    if (columns is None):
+        columns = columns_for()
+    if ('patient_id' not in columns):
+        columns = ['patient_id'] + list(columns)
+    rss_before = peak_rss_mb()
+
+    if (any(DTYPES[name] == 'text' for name in columns)):
+        # free text is never cached
+        frame = read_projected_csv(path, columns)
+    else:
+        key = file_key(path)
+        cache_path = os.path.join(cache_dir, key)
+        if (not os.path.exists(cache_path)):
+            check_fields()
+            write_cache(read_projected_csv(path, stored_columns()),
+                        cache_path)
+            drop_stale_caches(cache_dir, key)
+        frame = read_cache(cache_path, columns)
+
+    if (verbose):
+        print('Loaded %d rows x %d columns, peak RSS %.1f MB -> %.1f MB' %
+              (len(frame), len(columns), rss_before, peak_rss_mb()))
+    return frame.set_index('patient_id')
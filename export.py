@@ -0,0 +1,61 @@
+import datetime
+import json
+
+
+def unix_to_str_date(u):
+    return datetime.datetime.fromtimestamp(u).strftime('%d.%m.%Y')
+
+
+def flatten(doc, prefix=''):
+    # turn nested sub-documents into dotted keys, the way mongoexport
+    # names the columns listed in fields.txt
+    flat = {}
+    for key, value in doc.items():
+        name = prefix + key
+        if (isinstance(value, dict)):
+            flat.update(flatten(value, name + '.'))
+        else:
+            flat[name] = value
+    return flat
+
+
+def format_value(value):
+    # mimic mongoexport csv output
+    if (value is None):
+        return ''
+    if (isinstance(value, bool)):
+        return 'true' if value else 'false'
+    if (isinstance(value, float) and value.is_integer()):
+        return str(int(value))
+    if (isinstance(value, (list, dict))):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def export_pipeline(fields):
+    # unwind cards collection around stents array and let the server
+    # drop every column that is not exported
+    projection = {'_id': 0, 'patient_id': '$_id', 'updatedAt': 1}
+    for field in fields:
+        if (field != 'patient_id'):
+            projection[field] = 1
+    return [{'$unwind': '$stents'}, {'$project': projection}]
+
+
+def export_rows(cursor, fields, mark=None):
+    # yield csv rows for unwound documents, keeping track of the
+    # newest card seen in mark
+    for doc in cursor:
+        doc = flatten(doc)
+        created = doc.get('createdAt')
+        if (mark is not None):
+            key = (created or 0, str(doc.get('patient_id')))
+            if (key > (mark.get('createdAt', 0), mark.get('_id', ''))):
+                mark['createdAt'], mark['_id'] = key
+            updated = doc.get('updatedAt')
+            if (updated is not None and
+                    updated > mark.get('updatedAt', 0)):
+                mark['updatedAt'] = updated
+        if (created is not None):
+            doc['createdAt'] = unix_to_str_date(int(created / 1000))
+        yield [format_value(doc.get(field)) for field in fields]
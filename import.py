@@ -1,37 +1,189 @@
 #!/usr/bin/env python
 
+import argparse
+import csv
+import json
+import os
 import subprocess
-import datetime
+import time
 
+from bson import ObjectId
 from pymongo import MongoClient
 
+from export import export_pipeline, export_rows, unix_to_str_date
+from schema import read_fields
 
-def unix_to_str_date(u):
-    return datetime.datetime.fromtimestamp(u).strftime('%d.%m.%Y')
 
+def report_throughput(rows, path, started):
+    elapsed = time.time() - started
+    print('Exported %d rows to %s in %.2f s (%.0f rows/sec)' %
+          (rows, path, elapsed, rows / elapsed if elapsed else 0))
 
-client = MongoClient('mongodb://localhost:27017/')
-db = client.stents
-cards = db.cards
-csvexp = db.csvexp
 
-# clear the export collection
-csvexp.remove()
+def stream_export(cards, path='./in/st.csv', fields_path='./in/fields.txt',
+                  batch_size=1000, mark=None):
+    fields = read_fields(fields_path)
+    cursor = cards.aggregate(export_pipeline(fields), allowDiskUse=True,
+                             batchSize=batch_size)
+    started = time.time()
+    rows = 0
+    with open(path, 'w', encoding='UTF-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for row in export_rows(cursor, fields, mark):
+            writer.writerow(row)
+            rows += 1
+    report_throughput(rows, path, started)
+    return rows
 
-# unwind cards collection around stents array
-pipeline = [{'$unwind': '$stents'}]
-unwound_cards = cards.aggregate(pipeline)
 
-# save unwound documents into csvexp collection
-# patch _id and createdAt
-for doc in unwound_cards[u'result']:
-    doc[u'patient_id'] = doc[u'_id']
-    doc[u'createdAt'] = unix_to_str_date(int(doc[u'createdAt'] / 1000))
-    del doc[u'_id']
-    csvexp.insert(doc)
+def watermark_path(path):
+    return path + '.watermark'
 
-# generate csv file using mongoexport utility
-out = subprocess.getoutput(
-    'mongoexport -d stents -c csvexp -o ./in/stents.csv '
-    '-fieldFile ./in/fields.txt --csv')
-print(out)
+
+def load_watermark(path):
+    if (not os.path.exists(watermark_path(path)) or
+            not os.path.exists(path)):
+        return None
+    with open(watermark_path(path), encoding='UTF-8') as f:
+        return json.load(f)
+
+
+def save_watermark(path, mark):
+    tmp = watermark_path(path) + '.tmp'
+    with open(tmp, 'w', encoding='UTF-8') as f:
+        json.dump(mark, f)
+    os.replace(tmp, watermark_path(path))
+
+
+def card_id(value):
+    # the watermark keeps ids as strings; ObjectIds have to be compared
+    # as ObjectIds on the server
+    if (ObjectId.is_valid(value) and len(value) == 24):
+        return ObjectId(value)
+    return value
+
+
+def changed_cards_filter(mark):
+    # cards created after the watermark, plus cards edited since then
+    # for collections that maintain updatedAt
+    newer = [{'createdAt': {'$gt': mark['createdAt']}},
+             {'createdAt': mark['createdAt'],
+              '_id': {'$gt': card_id(mark['_id'])}}]
+    if ('updatedAt' in mark):
+        newer.append({'updatedAt': {'$gt': mark['updatedAt']}})
+    return {'$or': newer}
+
+
+def edited_cards_filter(mark):
+    # cards already in the export that were edited since then
+    exported = [{'createdAt': {'$lt': mark['createdAt']}},
+                {'createdAt': mark['createdAt'],
+                 '_id': {'$lte': card_id(mark['_id'])}}]
+    return {'updatedAt': {'$gt': mark['updatedAt']}, '$or': exported}
+
+
+def incremental_export(cards, path='./in/st.csv',
+                       fields_path='./in/fields.txt', batch_size=1000):
+    mark = load_watermark(path)
+    if (mark is None or 'createdAt' not in mark):
+        # no dataset yet, or one without a single stent: do a full export
+        # and remember where it ended
+        mark = {}
+        stream_export(cards, path, fields_path, batch_size, mark)
+        save_watermark(path, mark)
+        return
+
+    started = time.time()
+    new_mark = dict(mark)
+    # Only edited cards have rows in the file that need replacing. Their
+    # ids come from the cards themselves, since a card whose stents were
+    # all removed has no rows left in the export.
+    edited = set()
+    if ('updatedAt' in mark):
+        for card in cards.find(edited_cards_filter(mark),
+                               {'_id': 1, 'updatedAt': 1}):
+            edited.add(str(card['_id']))
+            new_mark['updatedAt'] = max(new_mark['updatedAt'],
+                                        card['updatedAt'])
+
+    fields = read_fields(fields_path)
+    pipeline = export_pipeline(fields)
+    pipeline.insert(0, {'$match': changed_cards_filter(mark)})
+    cursor = cards.aggregate(pipeline, allowDiskUse=True,
+                             batchSize=batch_size)
+    rows = list(export_rows(cursor, fields, new_mark))
+    if (not rows and not edited):
+        print('No new or changed cards since the last export')
+        return
+
+    if (edited):
+        # rows of edited cards are replaced as a whole, so that stents
+        # removed from a card disappear too
+        patient_col = fields.index('patient_id')
+        tmp = path + '.tmp'
+        with open(path, encoding='UTF-8', newline='') as f, \
+                open(tmp, 'w', encoding='UTF-8', newline='') as out:
+            writer = csv.writer(out)
+            for i, row in enumerate(csv.reader(f)):
+                if (not i or row[patient_col] not in edited):
+                    writer.writerow(row)
+            writer.writerows(rows)
+        os.replace(tmp, path)
+    else:
+        # only brand new cards: append without reading the file
+        with open(path, 'a', encoding='UTF-8', newline='') as f:
+            csv.writer(f).writerows(rows)
+    save_watermark(path, new_mark)
+    report_throughput(len(rows), path, started)
+
+
+def staged_export(db):
+    cards = db.cards
+    csvexp = db.csvexp
+
+    # clear the export collection
+    csvexp.remove()
+
+    # unwind cards collection around stents array
+    pipeline = [{'$unwind': '$stents'}]
+    unwound_cards = cards.aggregate(pipeline)
+
+    # save unwound documents into csvexp collection
+    # patch _id and createdAt
+    for doc in unwound_cards[u'result']:
+        doc[u'patient_id'] = doc[u'_id']
+        doc[u'createdAt'] = unix_to_str_date(int(doc[u'createdAt'] / 1000))
+        del doc[u'_id']
+        csvexp.insert(doc)
+
+    # generate csv file using mongoexport utility
+    out = subprocess.getoutput(
+        'mongoexport -d stents -c csvexp -o ./in/stents.csv '
+        '-fieldFile ./in/fields.txt --csv')
+    print(out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Export unwound stent cards to csv')
+    parser.add_argument('--mongo', default='mongodb://localhost:27017/')
+    parser.add_argument('--stream', action='store_true',
+                        help='stream the aggregation cursor straight to '
+                             'csv instead of staging it in csvexp')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only fetch cards added or changed since the '
+                             'watermark saved next to the output file')
+    parser.add_argument('--out', default='./in/st.csv')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo)
+    db = client.stents
+    if (args.incremental):
+        incremental_export(db.cards, path=args.out,
+                           batch_size=args.batch_size)
+    elif (args.stream):
+        stream_export(db.cards, path=args.out, batch_size=args.batch_size)
+    else:
+        staged_export(db)
@@ -0,0 +1,99 @@
+import json
+import time
+
+from schema import peak_rss_mb
+
+
+# Optional per-stage instrumentation of the report. When ENABLED is
+# False, stage() hands out a shared no-op object, so the instrumented
+# code pays one function call per stage and nothing else.
+
+ENABLED = False
+RECORDS = []
+
+
+class NoStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NO_STAGE = NoStage()
+
+
+class Stage(object):
+
+    def __init__(self, name, task=None, rows_in=None):
+        self.name = name
+        self.task = task
+        self.rows_in = rows_in
+        self.rows_out = None
+
+    def __enter__(self):
+        self.rss = peak_rss_mb()
+        self.cpu = time.process_time()
+        self.wall = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        RECORDS.append({
+            'stage': self.name,
+            'task': self.task,
+            'wall': time.time() - self.wall,
+            'cpu': time.process_time() - self.cpu,
+            'peak_rss_delta_mb': peak_rss_mb() - self.rss,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+        })
+        return False
+
+
+def stage(name, task=None, rows_in=None):
+    if (not ENABLED):
+        return NO_STAGE
+    return Stage(name, task, rows_in)
+
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+
+def drain():
+    # hand the records of a worker process back to the parent
+    records = list(RECORDS)
+    del RECORDS[:]
+    return records
+
+
+def write_json(path):
+    with open(path, 'w', encoding='UTF-8') as f:
+        json.dump(RECORDS, f, indent=1, ensure_ascii=False)
+
+
+def print_summary():
+    print('%-10s %-12s %9s %9s %9s %9s %9s' %
+          ('task', 'stage', 'wall, s', 'cpu, s', 'rss, MB', 'rows in',
+           'rows out'))
+    for r in RECORDS:
+        print('%-10s %-12s %9.3f %9.3f %9.1f %9s %9s' %
+              (r['task'] or '-', r['stage'], r['wall'], r['cpu'],
+               r['peak_rss_delta_mb'],
+               '-' if r['rows_in'] is None else r['rows_in'],
+               '-' if r['rows_out'] is None else r['rows_out']))
+
+    # totals per stage
+    totals = {}
+    for r in RECORDS:
+        total = totals.setdefault(r['stage'], [0.0, 0.0])
+        total[0] += r['wall']
+        total[1] += r['cpu']
+    print('')
+    for name in sorted(totals, key=lambda n: -totals[n][0]):
+        print('%-23s %9.3f %9.3f' % (name, totals[name][0], totals[name][1]))
@@ -0,0 +1,103 @@
+import os
+
+import pandas as pd
+
+from artifacts import IMAGES, OUT_DIR
+from instrument import stage
+
+
+# What a run writes: images drawn by barh() and the tables behind every
+# task. Tables of all tasks go to a single workbook written in one
+# writer session, and optionally to a csv and a json file each.
+
+FORMATS = ['png', 'svg', 'xlsx', 'csv', 'json']
+IMAGE_FORMATS = ['png', 'svg']
+DPI = {'png': IMAGES['png'], 'svg': 72}
+WORKBOOK = 'report.xlsx'
+
+
+def new_outputs(formats=('png', 'xlsx'), dpi=None, engine=None,
+                constant_memory=False):
+    # formats: any of FORMATS; dpi: image format -> dpi; engine: pandas
+    # Excel engine, e.g. 'xlsxwriter' or 'openpyxl'
+    unknown = set(formats) - set(FORMATS)
+    if (unknown):
+        raise ValueError('unknown formats: %s' % ', '.join(sorted(unknown)))
+    dpi = dict(DPI, **(dpi or {}))
+    return {'formats': list(formats),
+            'images': dict((fmt, dpi[fmt]) for fmt in IMAGE_FORMATS
+                           if fmt in formats),
+            'engine': engine,
+            'constant_memory': constant_memory}
+
+
+OUTPUTS = new_outputs()
+
+
+def cell(value):
+    # xlsxwriter takes plain numbers and strings; missing values are
+    # left blank, as to_excel() does
+    if (hasattr(value, 'item')):
+        value = value.item()
+    if (value is None or (isinstance(value, float) and value != value)):
+        return None
+    if (not isinstance(value, (int, float, str))):
+        return str(value)
+    return value
+
+
+def write_rows(book, sheet, frame):
+    # the to_excel() layout written row by row: index names and column
+    # labels on the first row, then the index and values of every row
+    worksheet = book.add_worksheet(sheet)
+    labels = [' / '.join(map(str, label)) if isinstance(label, tuple)
+              else label for label in frame.columns]
+    worksheet.write_row(0, 0, [cell(value) for value in
+                               list(frame.index.names) + labels])
+    for row, (key, values) in enumerate(zip(frame.index,
+                                            frame.values.tolist()), 1):
+        key = list(key) if isinstance(key, tuple) else [key]
+        worksheet.write_row(row, 0, [cell(value) for value in key + values])
+
+
+def write_workbook(tables, path, outputs=OUTPUTS):
+    # tables: (sheet name, frame or series) in sheet order
+    if (outputs['constant_memory']):
+        # xlsxwriter flushes every row as soon as the next one starts,
+        # while to_excel() writes column by column, so the sheets are
+        # written here row by row
+        if (outputs['engine'] not in (None, 'xlsxwriter')):
+            raise ValueError('constant memory mode needs xlsxwriter')
+        import xlsxwriter
+        writer = xlsxwriter.Workbook(path, {'constant_memory': True})
+    else:
+        writer = pd.ExcelWriter(path, engine=outputs['engine'])
+    for sheet, frame in tables:
+        # convert Series into DataFrame, if needed
+        if (isinstance(frame, pd.Series)):
+            frame = pd.DataFrame(frame)
+        with stage('xlsx', sheet, rows_in=len(frame)):
+            if (outputs['constant_memory']):
+                write_rows(writer, sheet, frame)
+            else:
+                frame.to_excel(writer, sheet_name=sheet)
+    with stage('xlsx', os.path.basename(path)):
+        if (outputs['constant_memory']):
+            writer.close()
+        else:
+            writer.save()
+
+
+def write_tables(tables, outputs=OUTPUTS, out_dir=OUT_DIR,
+                 workbook=WORKBOOK):
+    formats = outputs['formats']
+    if ('xlsx' in formats):
+        write_workbook(tables, os.path.join(out_dir, workbook), outputs)
+    for sheet, frame in tables:
+        path = os.path.join(out_dir, sheet)
+        if ('csv' in formats):
+            with stage('csv', sheet, rows_in=len(frame)):
+                frame.to_csv(path + '.csv', encoding='UTF-8')
+        if ('json' in formats):
+            with stage('json', sheet, rows_in=len(frame)):
+                frame.to_json(path + '.json', force_ascii=False)
@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import re
+import traceback
+
+import instrument
+from artifacts import OUT_DIR
+from dataset import load_stents
+from outputs import OUTPUTS
+from report import init_worker
+from schema import columns_for
+from tasks import new_run, run_tasks
+
+
+PARTITIONS = ['clinic', 'region', 'producer']
+
+
+def partition_dir(by, key, out_dir=OUT_DIR):
+    # clinic names carry quotes and such; keep them readable but safe
+    name = re.sub(r'[\\/:*?"<>|]+', '_', str(key)).strip(' ._') or '_'
+    return os.path.join(out_dir, by, name)
+
+
+def restrict(part):
+    # patients outside of a subset of the table must not show up in
+    # people
+    if (hasattr(part.index, 'remove_unused_categories')):
+        part.index = part.index.remove_unused_categories()
+    return part
+
+
+def split(stents, by):
+    # one pass over the table, one frame per value of the column
+    for key, part in stents.groupby(by, sort=False):
+        if (len(part)):
+            yield key, restrict(part)
+
+
+def run_partition(job):
+    path, names, by, key, part, cache, outputs, out_dir = job
+    out_dir = partition_dir(by, key, out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    print('%s: %s (%d stents) -> %s' % (by, key, len(part), out_dir))
+    try:
+        run_tasks(new_run(path, names, {'stents': part}), 1, cache,
+                  out_dir, outputs)
+    except Exception:
+        # one broken partition must not stop the others
+        return key, instrument.drain(), traceback.format_exc()
+    return key, instrument.drain(), None
+
+
+def run_partitioned(path, by, names=None, workers=1, cache=True,
+                    outputs=OUTPUTS, out_dir=OUT_DIR):
+    # load once, report on the whole registry, then on every partition;
+    # partitions are spread over a process pool. Returns the partitions
+    # that failed.
+    columns = columns_for(names)
+    if (by not in columns):
+        columns.append(by)
+    stents = load_stents(path, columns, verbose=True)
+    run_tasks(new_run(path, names, {'stents': stents}), workers, cache,
+              out_dir, outputs)
+
+    jobs = [(path, names, by, key, part, cache, outputs, out_dir)
+            for key, part in split(stents, by)]
+    pool = None
+    if (workers <= 1):
+        results = map(run_partition, jobs)
+    else:
+        pool = multiprocessing.Pool(workers, initializer=init_worker,
+                                    initargs=(instrument.ENABLED,))
+        results = pool.imap_unordered(run_partition, jobs)
+    failed = []
+    try:
+        for key, records, error in results:
+            instrument.RECORDS.extend(records)
+            if (error):
+                print('%s: %s failed\n%s' % (by, key, error))
+                failed.append(key)
+    finally:
+        if (pool is not None):
+            pool.close()
+            pool.join()
+    if (failed):
+        print('%d of %d partitions failed: %s' %
+              (len(failed), len(jobs), ', '.join(map(str, failed))))
+    return failed
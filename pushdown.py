@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+from cube import PEOPLE_DIMS, STENT_DIMS, cube_from_keys
+from export import format_value
+from instrument import stage
+from schema import DTYPES
+from stream import cast_int_levels
+from tasks import TASKS
+
+
+# Counts and means computed by MongoDB itself: one $unwind of the
+# stents followed by a $facet with a sub-pipeline per intermediate, so
+# that only the aggregated cells cross the wire. The results are the
+# same intermediates tasks.NODES would build from the export.
+
+PUSHDOWN_NODES = ['stents_cube', 'people_cube', 'mean_age']
+PUSHDOWN_TASKS = [task['name'] for task in TASKS
+                  if set(task['inputs']) <= set(PUSHDOWN_NODES)]
+
+
+def group_key(names):
+    # field names of a $group key may not contain dots
+    return dict(('d%d' % i, '$' + name) for i, name in enumerate(names))
+
+
+def first_row(dims):
+    # one row per card, as people_node() does after the $unwind
+    group = {'_id': '$_id', 'age': {'$first': '$patient.age'}}
+    for i, dim in enumerate(dims):
+        group['d%d' % i] = {'$first': '$' + dim}
+    return {'$group': group}
+
+
+FACETS = {
+    'stents_cube': [
+        {'$group': {'_id': group_key(STENT_DIMS), 'count': {'$sum': 1}}}],
+    'people_cube': [
+        first_row(PEOPLE_DIMS),
+        {'$group': {'_id': group_key(['d%d' % i
+                                      for i in range(len(PEOPLE_DIMS))]),
+                    'count': {'$sum': 1}}}],
+    'mean_age': [
+        first_row(['patient.sex']),
+        {'$group': {'_id': '$d0', 'age': {'$avg': '$age'}}}],
+}
+
+
+def pushdown_nodes(names=None):
+    # intermediates needed by the given tasks, all of which must be
+    # computable by the server
+    if (names is None):
+        names = PUSHDOWN_TASKS
+    rest = sorted(set(names) - set(PUSHDOWN_TASKS))
+    if (rest):
+        raise ValueError('tasks %s need the full export' % ', '.join(rest))
+    nodes = []
+    for task in TASKS:
+        if (task['name'] in names):
+            nodes.extend(node for node in task['inputs']
+                         if node not in nodes)
+    return nodes
+
+
+def pushdown_pipeline(nodes):
+    return [{'$unwind': '$stents'},
+            {'$facet': dict((node, FACETS[node]) for node in nodes)}]
+
+
+def to_value(value):
+    # the value the csv export would hold for a server-side one
+    value = format_value(value)
+    return None if value == '' else value
+
+
+def facet_cube(docs, dims):
+    # count cube from the cells of a $group over the dimensions; levels
+    # are parsed the way the csv export would be
+    levels = []
+    sizes = []
+    key = np.zeros(len(docs), dtype=np.int64)
+    for i, dim in enumerate(dims):
+        values = [to_value(doc['_id'].get('d%d' % i)) for doc in docs]
+        observed = np.array([value is not None for value in values],
+                            dtype=bool)
+        if (DTYPES[dim].startswith('int')):
+            parsed = np.array([np.nan if value is None else float(value)
+                               for value in values])
+        else:
+            parsed = np.array(values, dtype=object)
+        uniques = np.unique(parsed[observed])
+        codes = np.empty(len(docs), dtype=np.int64)
+        codes.fill(len(uniques))
+        codes[observed] = np.searchsorted(uniques, parsed[observed])
+        key = key * (len(uniques) + 1) + codes
+        levels.append(uniques)
+        sizes.append(len(uniques) + 1)
+    counts = np.array([doc['count'] for doc in docs], dtype=np.int64)
+    return cast_int_levels(cube_from_keys(dims, levels, sizes, key, counts))
+
+
+def mean_or_nan(value):
+    return np.nan if value is None else float(value)
+
+
+def facet_mean_age(docs):
+    ages = dict((to_value(doc['_id']), mean_or_nan(doc['age']))
+                for doc in docs if to_value(doc['_id']) is not None)
+    mean_age = pd.Series(ages, dtype=np.float64).sort_index()
+    mean_age.name = 'patient.age'
+    mean_age.index.name = 'patient.sex'
+    return mean_age
+
+
+def pushdown_aggregate(cards, names=None):
+    # cards: the cards collection of a real server, or anything with the
+    # same aggregate() for testing
+    nodes = pushdown_nodes(names)
+    with stage('pushdown'):
+        result = list(cards.aggregate(pushdown_pipeline(nodes),
+                                      allowDiskUse=True))[0]
+    known = {}
+    if ('stents_cube' in nodes):
+        known['stents_cube'] = facet_cube(result['stents_cube'], STENT_DIMS)
+    if ('people_cube' in nodes):
+        known['people_cube'] = facet_cube(result['people_cube'],
+                                          PEOPLE_DIMS)
+    if ('mean_age' in nodes):
+        known['mean_age'] = facet_mean_age(result['mean_age'])
+    return known
+
+
+def mongo_pushdown(url='mongodb://localhost:27017/', names=None):
+    from pymongo import MongoClient
+    return pushdown_aggregate(MongoClient(url).stents.cards, names)
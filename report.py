@@ -0,0 +1,249 @@
+import functools
+import multiprocessing
+import os
+
+import pandas as pd
+import numpy as np
+
+import instrument
+from artifacts import IMAGES, OUT_DIR, is_fresh, load_manifest, record, \
+    save_manifest
+from cube import cube_counts, cube_value_counts
+from instrument import stage
+
+
+# matplotlib.pyplot, imported by the first chart that is drawn, so that
+# runs writing only tables never import matplotlib
+plt = None
+
+
+def setup_pandas():
+    pd.options.mode.chained_assignment = None
+
+
+def setup_matplotlib():
+    # every process that renders charts must use the same settings,
+    # otherwise output would depend on which worker drew it
+    global plt
+    if (plt is None):
+        import matplotlib as mpl
+        mpl.use('Agg')
+        mpl.rcParams['font.family'] = 'fantasy'
+        mpl.rcParams['font.fantasy'] = 'Arial'
+        from matplotlib import pyplot
+        plt = pyplot
+    setup_pandas()
+
+
+def init_worker(profile=False):
+    setup_pandas()
+    instrument.enable(profile)
+
+
+def bar_labels(frame, stacked=False, hidevalue=5):
+    # Positions of the value labels straight from the plotted frame, the
+    # way frame.plot(kind='barh') lays the bars out: row i is centered
+    # at y = i, columns share the 0.5 wide slot unless stacked. Returns
+    # x, y, value and whether the label sits inside its bar, column by
+    # column, for the labels that are shown.
+    values = np.asarray(frame, dtype=np.float64)
+    if (values.ndim == 1):
+        values = values[:, np.newaxis]
+    rows, columns = values.shape
+    y = np.repeat(np.arange(rows, dtype=np.float64)[:, np.newaxis],
+                  columns, axis=1)
+    if (stacked):
+        ends = np.cumsum(values, axis=1)
+    else:
+        ends = values
+        y += (np.arange(columns) - (columns - 1) / 2.0) * 0.5 / columns
+    inside = values >= hidevalue
+    # small values are written after the bar, or not at all when stacked
+    shown = inside | (not stacked)
+    x = np.where(inside, 0.98 * ends, ends + 1)
+    shown = shown.T
+    return x.T[shown], y.T[shown], values.T[shown], inside.T[shown]
+
+
+def barh(frame, title='', color='', xlabel='', ylabel='',
+         format_str='%s', integer=True,
+         figsize=(8, 6), stacked=False, hidevalue=5,
+         legend=False, legend_title='', legend_loc=1,
+         filename='figure.png', out_dir=OUT_DIR, images=IMAGES):
+
+    setup_matplotlib()
+    with stage('plot', filename):
+        # plot horizontal bar chart
+        fig = plt.figure(figsize=figsize)
+        ax = fig.add_subplot(111)
+        frame.plot(kind='barh', ax=ax, title=title, color=color,
+                   stacked=stacked, legend=False)
+
+        # print value inside each bar, or after it when it is small;
+        # labels are added in one batch per style
+        x, y, values, inside = bar_labels(frame, stacked, hidevalue)
+        if (integer):
+            texts = [format_str % str(int(value)) for value in values]
+        else:
+            texts = [format_str % str(value) for value in values]
+        texts = np.array(texts, dtype=object)
+        for batch, text_color, text_ha in ((inside, 'white', 'right'),
+                                           (~inside, 'black', 'left')):
+            for xloc, yloc, text in zip(x[batch], y[batch], texts[batch]):
+                ax.text(xloc, yloc, text, ha=text_ha, va='center',
+                        color=text_color, style='normal', weight='bold')
+
+        # add x and y axis labels
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+
+        # patch long yticklabels
+        yticklabels = ax.get_yticklabels()
+        newlabels = [label.get_text().replace(', ', ',\n')
+                     for label in yticklabels]
+        ax.set_yticklabels(newlabels)
+
+        # add legend
+        if (legend):
+            patches, labels = ax.get_legend_handles_labels()
+            ax.legend(patches, labels, title=legend_title, loc=legend_loc)
+
+    if (instrument.ENABLED):
+        # only drawn separately when profiling, to tell text layout and
+        # rasterization apart from image encoding
+        with stage('layout', filename):
+            fig.canvas.draw()
+
+    # save figure in every image format, e.g. .png and .svg; the frame
+    # itself is written by outputs.write_tables()
+    for fmt, dpi in sorted(images.items()):
+        with stage(fmt, filename):
+            plt.savefig(os.path.join(out_dir, filename + '.' + fmt),
+                        bbox_inches='tight', dpi=dpi)
+    plt.close(fig)
+
+
+def chart(frame, **options):
+    # a chart job: the aggregated frame plus barh() arguments
+    return (frame, options)
+
+
+def render(job, out_dir=OUT_DIR):
+    frame, options = job
+    with stage('render', options.get('filename'), rows_in=len(frame)):
+        barh(frame=frame, out_dir=out_dir, **options)
+    return options.get('filename')
+
+
+def render_in_worker(job, out_dir=OUT_DIR):
+    return render(job, out_dir), instrument.drain()
+
+
+def render_all(jobs, workers=1, cache=True, out_dir=OUT_DIR,
+               images=IMAGES):
+    # charts whose frame and options are unchanged since the last run
+    # are not drawn again; the image formats are part of the options
+    jobs = [(frame, dict(options, images=images)) for frame, options in jobs]
+    # charts without any bars, e.g. the impressions of a region where no
+    # stent was rated, are not drawn
+    empty = [options['filename'] for frame, options in jobs
+             if not frame.size]
+    if (empty):
+        print('Nothing to draw for %s' % ', '.join(empty))
+    jobs = [job for job in jobs if job[0].size]
+    # the manifest is kept even when nothing is taken from it, so that
+    # --clean still knows every chart drawn before
+    manifest = load_manifest(out_dir)
+    todo = [job for job in jobs
+            if not (cache and is_fresh(manifest, job, out_dir))]
+    if (len(todo) < len(jobs)):
+        print('%d of %d charts are up to date' %
+              (len(jobs) - len(todo), len(jobs)))
+
+    # rendering is CPU-bound, so charts are spread over a process pool;
+    # jobs only carry small aggregated frames
+    if (workers <= 1):
+        done = [render(job, out_dir) for job in todo]
+    else:
+        pool = multiprocessing.Pool(workers, initializer=init_worker,
+                                    initargs=(instrument.ENABLED,))
+        try:
+            done = []
+            worker = functools.partial(render_in_worker, out_dir=out_dir)
+            for filename, records in pool.map(worker, todo, chunksize=1):
+                done.append(filename)
+                instrument.RECORDS.extend(records)
+        finally:
+            pool.close()
+            pool.join()
+
+    for job in jobs:
+        record(manifest, job)
+    save_manifest(manifest, out_dir)
+    return done
+
+
+def stents_chart_basic(cube, groupby,
+                       dataslice=False, title='', color='m',
+                       figsize=(8, 6), xlabel='', ylabel='',
+                       integer=True, filename='figure.png'):
+    frame = cube_counts(cube, groupby)
+    frame = frame.sort_values(ascending=False)
+    if (dataslice):
+        sliced_frame = frame[dataslice[0]:dataslice[1]]
+    else:
+        sliced_frame = frame
+    return chart(sliced_frame,
+                 title=title, color=color, legend=False,
+                 figsize=figsize, xlabel=xlabel, ylabel=ylabel,
+                 integer=integer, filename=filename)
+
+
+def stents_chart_stacked(cube, groupby, sortby,
+                         dataslice=False, title='', color='m',
+                         figsize=(8, 6), xlabel='', ylabel='',
+                         integer=True, filename='figure.png'):
+    frame = cube_counts(cube, groupby)
+    unstacked_frame = frame.unstack()
+    # one column for every level, also when a part of the registry
+    # (e.g. a clinic with women only) has no rows for some of them
+    levels = cube['levels'][cube['dims'].index(groupby[1])]
+    unstacked_frame = unstacked_frame.reindex(
+        columns=pd.Index(levels, name=groupby[1]))
+    unstacked_frame.fillna(value=0, inplace=True)
+    sorted_frame = unstacked_frame.sort_values(by=sortby, ascending=False)
+    if (dataslice):
+        sliced_frame = sorted_frame[dataslice[0]:dataslice[1]]
+    else:
+        sliced_frame = sorted_frame
+    return chart(sliced_frame,
+                 title=title, color=color, legend=True,
+                 figsize=figsize, xlabel=xlabel, ylabel=ylabel,
+                 integer=integer, stacked=True, filename=filename)
+
+
+def impressions_chart(people_cube):
+    conductance = cube_value_counts(people_cube, 'impressions.conductance')
+    conformability = cube_value_counts(people_cube,
+                                       'impressions.conformability')
+    delivery = cube_value_counts(people_cube, 'impressions.delivery')
+    flexibility = cube_value_counts(people_cube, 'impressions.flexibility')
+    recoil = cube_value_counts(people_cube, 'impressions.recoil')
+    overall = cube_value_counts(people_cube, 'impressions.overall')
+    names = {
+        0: 'проводимость',
+        1: 'прилегаемость',
+        2: 'система доставки',
+        3: 'гибкость',
+        4: 'recoil',
+        5: 'общие впечатления'
+    }
+    impressions = pd.concat([conductance, conformability, delivery,
+                            flexibility, recoil, overall],
+                            axis=1)
+    impressions.rename(columns=names, inplace=True)
+    impressions.fillna(value=0, inplace=True)
+    return chart(impressions[1:].transpose(),
+                 title=u'Впечатления от стентов', color='gryb', legend_loc=3,
+                 figsize=(10, 10), xlabel=u'Количество процедур стентирования',
+                 stacked=True, legend=True, hidevalue=20, filename='task16')
@@ -0,0 +1,100 @@
+import resource
+
+
+# Column layout of the csv export, in in/fields.txt order:
+# (name, dtype, tasks that read the column).
+# 'text' columns are free-form and never loaded unless asked for
+# explicitly; patient_id is the index of every loaded frame.
+SCHEMA = [
+    ('createdAt', 'date', ()),
+    ('patient_id', 'category', ()),
+    ('region', 'category', ()),
+    ('city', 'category', ()),
+    ('clinic', 'category', ()),
+    ('authorName', 'category', ()),
+    ('producer', 'category', ()),
+    ('patient.name', 'text', ()),
+    ('patient.sex', 'category',
+     ('1', '2', '3b', '4b', '5b', '14', '15')),
+    ('patient.age', 'int8', ('2', '14', '15')),
+    ('patient.death', 'bool', ()),
+    ('patient.deathdate', 'date', ()),
+    ('hospitalization.diagnosis', 'category',
+     ('3a', '3b', '8', '14', '15')),
+    ('hospitalization.finishedAt', 'date', ()),
+    ('hospitalization.intervention', 'category', ()),
+    ('hospitalization.localization', 'category', ()),
+    ('hospitalization.mdrNo', 'text', ()),
+    ('hospitalization.notes', 'text', ()),
+    ('hospitalization.startedAt', 'date', ()),
+    ('impressions.flexibility', 'category', ('16',)),
+    ('impressions.conductance', 'category', ('16',)),
+    ('impressions.conformability', 'category', ('16',)),
+    ('impressions.recoil', 'category', ('16',)),
+    ('impressions.delivery', 'category', ('16',)),
+    ('impressions.overall', 'category', ('16',)),
+    ('stents._id', 'text', ()),
+    ('stents.segmentNo', 'int8',
+     ('4a', '4b', '8', '13', '14', '15')),
+    ('stents.vesselDia', 'float32', ()),
+    ('stents.damageExt', 'float32', ()),
+    ('stents.timi', 'category', ()),
+    ('stents.stenosisType', 'category',
+     ('5a', '5b', '13', '14', '15')),
+    ('stents.tortuosityDeg', 'category',
+     ('6', '7', '8', '13', '14', '15')),
+    ('stents.calcificationDeg', 'category',
+     ('8', '13', '14', '15')),
+    ('stents.predilatation', 'category', ('11a', '14', '15')),
+    ('stents.postdilatation', 'category', ('11b', '14', '15')),
+    ('stents.stent.producer', 'category', ()),
+    ('stents.stent.model', 'category', ()),
+    ('stents.stent.type', 'category', ('12', '14', '15')),
+    ('stents.stent.serialNo', 'text', ()),
+    ('stents.stent.len', 'float32', ('13',)),
+    ('stents.stent.dia', 'float32', ('13',)),
+    ('stents.hResults.success', 'category', ('9', '14', '15')),
+    ('stents.hResults.failureNotes', 'text', ()),
+    ('stents.hResults.replaced', 'category', ('10', '14', '15')),
+    ('stents.hResults.replaceNotes', 'text', ()),
+    ('stents.hResults.problems', 'text', ()),
+    ('stents.rResults.date', 'date', ()),
+    ('stents.rResults.timi', 'category', ()),
+    ('stents.rResults.problems', 'category', ('15',)),
+]
+
+DTYPES = dict((name, dtype) for name, dtype, tasks in SCHEMA)
+
+
+def read_fields(path='./in/fields.txt'):
+    with open(path, encoding='UTF-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def check_fields(path='./in/fields.txt'):
+    fields = read_fields(path)
+    declared = [name for name, dtype, tasks in SCHEMA]
+    if (fields != declared):
+        raise ValueError('schema does not match %s: %s' %
+                         (path, sorted(set(fields) ^ set(declared))))
+
+
+def columns_for(tasks=None):
+    # columns needed to run the given tasks (all of them by default),
+    # always including the patient_id index
+    columns = []
+    for name, dtype, used_by in SCHEMA:
+        if (name == 'patient_id' or
+                (used_by and (tasks is None or set(tasks) & set(used_by)))):
+            columns.append(name)
+    return columns
+
+
+def stored_columns():
+    # everything except free text goes into the typed cache
+    return [name for name, dtype, tasks in SCHEMA if dtype != 'text']
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
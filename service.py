@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import tempfile
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from corr import corr_tables, task_matrix
+from dataset import load_stents
+from outputs import write_workbook
+from partition import restrict
+from report import render, setup_matplotlib
+from schema import columns_for
+from tasks import TASKS, TASK_NAMES, build_chart, compute, new_run
+
+
+# Local stats service: the typed table and the unfiltered intermediates
+# stay in memory between requests.
+#
+#   GET  /tasks                    task names and kinds
+#   GET  /task/<name>.<format>     png, xlsx or json of a task, filtered
+#                                  by ?from=&to= (createdAt, YYYY-MM-DD),
+#                                  ?clinic= and ?stent_type=
+#   POST /reload[?input=path]      load a new export
+#
+# Drawing is done on a single thread, since pyplot is not thread-safe;
+# answers are kept in an LRU cache bounded by their total size.
+
+DATE_COLUMN = 'createdAt'
+FILTERS = {'clinic': 'clinic', 'stent_type': 'stents.stent.type'}
+PRECOMPUTED = ['stents_cube', 'people_cube', 'mean_age', 'stent_size']
+# intermediates of this many filter combinations are kept around
+FILTERED_RUNS = 8
+
+FORMATS = {
+    'png': 'image/png',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.'
+            'spreadsheetml.sheet',
+    'json': 'application/json; charset=utf-8',
+}
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class LRUCache(object):
+
+    def __init__(self, limit, weight=len):
+        self.limit = limit
+        self.weight = weight
+        self.total = 0
+        self.items = collections.OrderedDict()
+
+    def get(self, key):
+        value = self.items.pop(key, None)
+        if (value is not None):
+            self.items[key] = value
+        return value
+
+    def put(self, key, value):
+        if (key in self.items):
+            self.total -= self.weight(self.items.pop(key))
+        if (self.weight(value) > self.limit):
+            return
+        self.items[key] = value
+        self.total += self.weight(value)
+        while (self.total > self.limit):
+            key, value = self.items.popitem(last=False)
+            self.total -= self.weight(value)
+
+    def clear(self):
+        self.items.clear()
+        self.total = 0
+
+
+def load_state(path):
+    columns = columns_for()
+    for name in [DATE_COLUMN] + list(FILTERS.values()):
+        if (name not in columns):
+            columns.append(name)
+    stents = load_stents(path, columns, verbose=True)
+    run = new_run(path, None, {'stents': stents})
+    for name in PRECOMPUTED:
+        compute(run, name)
+    runs = LRUCache(FILTERED_RUNS, weight=lambda run: 1)
+    runs.put((), run)
+    return {'path': path, 'stents': stents, 'runs': runs}
+
+
+class BadRequest(Exception):
+    pass
+
+
+class MethodNotAllowed(Exception):
+    pass
+
+
+def parse_filters(query):
+    filters = {}
+    for name, values in parse_qs(query).items():
+        if (name not in ('from', 'to') and name not in FILTERS):
+            raise BadRequest('unknown filter: %s' % name)
+        if (name in ('from', 'to')):
+            try:
+                np.datetime64(values[-1], 'D')
+            except ValueError:
+                raise BadRequest('%s is not a date: %s' %
+                                 (name, values[-1]))
+        filters[name] = values[-1]
+    return tuple(sorted(filters.items()))
+
+
+def filtered_run(state, filters):
+    run = state['runs'].get(filters)
+    if (run is not None):
+        return run
+    stents = state['stents']
+    mask = np.ones(len(stents), dtype=bool)
+    for name, value in filters:
+        if (name == 'from'):
+            mask &= np.asarray(stents[DATE_COLUMN] >= np.datetime64(value))
+        elif (name == 'to'):
+            mask &= np.asarray(stents[DATE_COLUMN] <= np.datetime64(value))
+        else:
+            mask &= np.asarray(stents[FILTERS[name]].isin([value]))
+    run = new_run(state['path'], None, {'stents': restrict(stents[mask])})
+    state['runs'].put(filters, run)
+    return run
+
+
+def produce(state, name, fmt, filters):
+    # one format of a task; only a png needs drawing
+    run = filtered_run(state, filters)
+    if (not len(compute(run, 'stents'))):
+        raise LookupError('no stents match the filters')
+    task = TASKS[TASK_NAMES.index(name)]
+    if (task['kind'] == 'corr'):
+        if (fmt == 'png'):
+            raise LookupError('task %s has no png' % name)
+        correlations = compute(run, 'correlations')
+        if (fmt == 'json'):
+            return ('{"corr": %s, "assoc": %s}' % tuple(
+                task_matrix(correlations, task['output'], kind).to_json(
+                    force_ascii=False)
+                for kind in ('corr', 'assoc'))).encode('UTF-8')
+        filename = task['output']
+        tables = corr_tables(correlations, filename)
+    else:
+        frame, options = build_chart(run, task)
+        if (fmt == 'json'):
+            return frame.to_json(force_ascii=False).encode('UTF-8')
+        if (fmt == 'png' and not frame.size):
+            raise LookupError('nothing to draw for task %s' % name)
+        filename = options['filename']
+        tables = [(filename, frame)]
+    with tempfile.TemporaryDirectory(prefix='stents-service-') as tmp:
+        path = os.path.join(tmp, filename + '.' + fmt)
+        if (fmt == 'png'):
+            render((frame, options), tmp)
+        else:
+            write_workbook(tables, path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+class Service(object):
+
+    def __init__(self, path, cache_bytes):
+        self.state = load_state(path)
+        self.cache = LRUCache(cache_bytes)
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)
+
+    def call(self, function, *args):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, function, *args)
+
+    async def task(self, target, query):
+        name, _, fmt = target.rpartition('.')
+        if (name not in TASK_NAMES or fmt not in FORMATS):
+            raise LookupError('no such task or format: %s' % target)
+        filters = parse_filters(query)
+        body = self.cache.get((name, fmt, filters))
+        if (body is None):
+            state = self.state
+            body = await self.call(produce, state, name, fmt, filters)
+            if (state is self.state):
+                self.cache.put((name, fmt, filters), body)
+        return FORMATS[fmt], body
+
+    async def reload(self, query):
+        path = parse_qs(query).get('input', [self.state['path']])[-1]
+        self.state = await self.call(load_state, path)
+        self.cache.clear()
+        return {'input': path, 'rows': len(self.state['stents'])}
+
+    async def dispatch(self, method, target):
+        url = urlsplit(target)
+        if (url.path == '/tasks' and method == 'GET'):
+            tasks = [{'name': task['name'], 'kind': task['kind']}
+                     for task in TASKS]
+            return FORMATS['json'], json.dumps(tasks).encode('UTF-8')
+        if (url.path.startswith('/task/') and method == 'GET'):
+            return await self.task(url.path[len('/task/'):], url.query)
+        if (url.path == '/reload'):
+            if (method != 'POST'):
+                raise MethodNotAllowed('%s is not allowed on %s' %
+                                       (method, url.path))
+            answer = await self.reload(url.query)
+            return FORMATS['json'], json.dumps(answer).encode('UTF-8')
+        raise LookupError('not found: %s' % url.path)
+
+    async def handle(self, reader, writer):
+        status = 200
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            while ((await reader.readline()) not in (b'\r\n', b'\n', b'')):
+                pass
+            if (len(request) < 2):
+                raise BadRequest('bad request')
+            content_type, body = await self.dispatch(request[0],
+                                                     request[1])
+        except Exception as e:
+            if (isinstance(e, LookupError)):
+                status = 404
+            elif (isinstance(e, MethodNotAllowed)):
+                status = 405
+            elif (isinstance(e, BadRequest)):
+                status = 400
+            else:
+                status = 500
+            content_type = 'text/plain; charset=utf-8'
+            body = ('%s\n' % e).encode('UTF-8')
+        writer.write(('HTTP/1.1 %d %s\r\n'
+                      'Content-Type: %s\r\n'
+                      'Content-Length: %d\r\n'
+                      'Connection: close\r\n\r\n' %
+                      (status, REASONS[status], content_type,
+                       len(body))).encode('latin-1') + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the stents report')
+    parser.add_argument('--input', default='./in/st.csv')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--socket', default=None,
+                        help='listen on this unix socket instead of a port')
+    parser.add_argument('--cache-mb', type=int, default=64,
+                        help='size of the result cache')
+    args = parser.parse_args()
+
+    setup_matplotlib()
+    service = Service(args.input, args.cache_mb << 20)
+    loop = asyncio.get_event_loop()
+    if (args.socket):
+        server = loop.run_until_complete(
+            asyncio.start_unix_server(service.handle, args.socket))
+        print('Serving on %s' % args.socket)
+    else:
+        server = loop.run_until_complete(
+            asyncio.start_server(service.handle, args.host, args.port))
+        print('Serving on http://%s:%d/' % (args.host, args.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
@@ -0,0 +1,166 @@
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from corr import encode, task_matrix
+from cube import cube_counts
+from instrument import stage
+from tasks import TASK_NAMES, compute
+
+
+# Bootstrap confidence intervals for the shares of the count charts and
+# for mean age by sex, and permutation p-values for every cell of the
+# Pearson correlation matrix. Resamples are drawn in shards of SHARD,
+# each shard with its own seed derived from (seed, statistic, shard),
+# so that results do not depend on the number of worker processes.
+
+SHARD = 500
+# elements per index matrix, to bound memory of a batch of resamples
+BATCH = 10 ** 7
+ALPHA = 0.05
+
+
+def run_shard(shard):
+    function, seed, count, args = shard
+    return function(np.random.RandomState(seed), count, *args)
+
+
+def sharded(function, args, resamples, seed, workers=1):
+    shards = [(function, seed + [i], min(SHARD, resamples - start), args)
+              for i, start in enumerate(range(0, resamples, SHARD))]
+    if (workers <= 1):
+        return [run_shard(shard) for shard in shards]
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(run_shard, shards, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def proportion_resamples(rng, count, counts):
+    # resampling n rows of a categorical column with replacement is a
+    # multinomial draw over its counts
+    total = counts.sum()
+    return rng.multinomial(total, counts / float(total),
+                           size=count) / float(total)
+
+
+def mean_resamples(rng, count, values):
+    # one row of indices per resample
+    batch = max(1, BATCH // max(len(values), 1))
+    means = []
+    for start in range(0, count, batch):
+        index = rng.randint(0, len(values),
+                            size=(min(batch, count - start), len(values)))
+        means.append(values[index].mean(axis=1))
+    return np.concatenate(means)
+
+
+def permutation_exceed(rng, count, matrix, observed):
+    # Number of permutations with |r| at least the observed one, for
+    # every pair of columns at once: the rows of a copy of the matrix
+    # are shuffled and correlated against the original with the same
+    # pairwise complete sums as corr.pairwise_corr(). Only column i
+    # against permuted column j with i < j is counted and mirrored, so
+    # that the p-values are as symmetric as the correlations.
+    mask = ~np.isnan(matrix)
+    m = mask.astype(np.float64)
+    centered = np.where(mask, matrix - np.nanmean(matrix, axis=0), 0.0)
+    batch = max(1, BATCH // max(matrix.size, 1))
+    exceed = np.zeros(observed.shape, dtype=np.int64)
+    for start in range(0, count, batch):
+        size = min(batch, count - start)
+        index = np.argsort(rng.rand(size, len(matrix)), axis=1)
+        mp = m[index]
+        cp = centered[index]
+        n = np.matmul(m.T, mp)
+        sx = np.matmul(centered.T, mp)
+        sy = np.matmul(m.T, cp)
+        sxx = np.matmul((centered ** 2).T, mp)
+        syy = np.matmul(m.T, cp ** 2)
+        sxy = np.matmul(centered.T, cp)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx ** 2) *
+                                                 (n * syy - sy ** 2))
+        upper = np.triu((np.abs(corr) >= np.abs(observed) - 1e-12).sum(
+            axis=0), 1)
+        exceed += upper + upper.T
+    return exceed
+
+
+def interval(samples):
+    return np.percentile(samples, [100 * ALPHA / 2, 100 * (1 - ALPHA / 2)],
+                         axis=0)
+
+
+def proportion_table(counts, resamples, seed, workers=1):
+    counts = counts.sort_values(ascending=False)
+    values = np.asarray(counts, dtype=np.float64)
+    if (not values.sum()):
+        return pd.DataFrame(columns=['count', 'share', 'low', 'high'])
+    low, high = interval(np.concatenate(sharded(
+        proportion_resamples, (values,), resamples, seed, workers)))
+    return pd.DataFrame({'count': counts,
+                         'share': values / values.sum(),
+                         'low': low, 'high': high},
+                        columns=['count', 'share', 'low', 'high'])
+
+
+def mean_table(groups, resamples, seed, workers=1):
+    rows = []
+    index = []
+    for i, (key, values) in enumerate(groups):
+        values = np.asarray(values.dropna(), dtype=np.float64)
+        if (not len(values)):
+            continue
+        low, high = interval(np.concatenate(sharded(
+            mean_resamples, (values,), resamples, seed + [i], workers)))
+        rows.append((len(values), values.mean(), low, high))
+        index.append(key)
+    return pd.DataFrame(rows, index=index,
+                        columns=['count', 'mean', 'low', 'high'])
+
+
+def permutation_pvalues(stents, correlations, resamples, seed, workers=1):
+    matrix, levels = encode(stents, correlations['columns'])
+    exceed = sum(sharded(permutation_exceed, (matrix, correlations['corr']),
+                         resamples, seed, workers))
+    pvalues = (exceed + 1.0) / (resamples + 1.0)
+    pvalues[np.isnan(correlations['corr'])] = np.nan
+    np.fill_diagonal(pvalues, np.nan)
+    return {'columns': correlations['columns'], 'p': pvalues}
+
+
+def significance_tables(run, resamples=10000, seed=0, workers=1):
+    # <task>_ci and <task>_p tables, written along with the task tables
+    tables = []
+    pvalues = None
+    for task in run['tasks']:
+        # seeds follow the registry, not the selection of tasks
+        number = TASK_NAMES.index(task['name'])
+        kind = task['kind']
+        if (kind == 'corr'):
+            name = task['output']
+        elif (kind != 'impressions'):
+            name = task['chart']['filename']
+        with stage('significance', task['name']):
+            if (kind in ('counts', 'basic', 'stacked')):
+                cube = compute(run, task['inputs'][0])
+                tables.append((name + '_ci', proportion_table(
+                    cube_counts(cube, task.get('column') or task['groupby']),
+                    resamples, [seed, number], workers)))
+            elif (kind == 'series'):
+                people = compute(run, 'people')
+                tables.append((name + '_ci', mean_table(
+                    people.groupby('patient.sex')['patient.age'],
+                    resamples, [seed, number], workers)))
+            elif (kind == 'corr'):
+                if (pvalues is None):
+                    pvalues = permutation_pvalues(
+                        compute(run, 'stents'),
+                        compute(run, 'correlations'),
+                        resamples, [seed, number], workers)
+                tables.append((name + '_p', task_matrix(pvalues, name, 'p')))
+    return tables
@@ -1,444 +1,149 @@
-import pandas as pd
-import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-
-
-def compute_actual_widths(ax):
-    cs = len(ax.containers)
-    chperc = len(ax.containers[0].get_children())
-    widths = np.zeros(cs * chperc).reshape(chperc, cs)
-    for i, container in enumerate(ax.containers):
-        for j, child in enumerate(container.get_children()):
-            prev_width = 0
-            if (i > 0):
-                prev_width = widths[j][i - 1]
-            widths[j][i] = prev_width + child.get_width()
-    return widths
-
-
-def barh(frame, title='', color='', xlabel='', ylabel='',
-         format_str='%s', integer=True,
-         figsize=(8, 6), stacked=False, hidevalue=5,
-         legend=False, legend_title='', legend_loc=1,
-         filename='figure.png'):
-
-    # plot horizontal bar chart
-    fig = plt.figure(figsize=figsize)
-    ax = fig.add_subplot(111)
-    frame.plot(kind='barh', ax=ax, title=title, color=color, stacked=stacked,
-               legend=False)
-
-    # print value inside each bar
-    # stacked bars need some more care
-    if (stacked):
-        actual_widths = compute_actual_widths(ax)
-
-    for i, container in enumerate(ax.containers):
-        for j, child in enumerate(container.get_children()):
-            value = child.get_width()
-            width = value
-            if (stacked):
-                width = actual_widths[j][i]
-            if (integer):
-                text = str(int(value))
-            else:
-                text = str(value)
-            if (value < hidevalue):
-                if (stacked):
-                    continue
-                xloc = width + 1
-                text_color = 'black'
-                text_ha = 'left'
-            else:
-                xloc = 0.98 * width
-                text_color = 'white'
-                text_ha = 'right'
-            yloc = child.get_y() + child.get_height() / 2.0
-            plt.text(xloc, yloc, format_str % text, ha=text_ha, va='center',
-                     color=text_color, style='normal', weight='bold')
-
-    # add x and y axis labels
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
-
-    # patch long yticklabels
-    yticklabels = ax.get_yticklabels()
-    newlabels = [label.get_text().replace(', ', ',\n')
-                 for label in yticklabels]
-    ax.set_yticklabels(newlabels)
-
-    # add legend
-    if (legend):
-        patches, labels = ax.get_legend_handles_labels()
-        ax.legend(patches, labels, title=legend_title, loc=legend_loc)
-
-    # save figure as a .png file
-    plt.savefig('./out/' + filename + '.png', bbox_inches='tight', dpi=300)
-    plt.close(fig)
-
-    # save frame into a worksheet in Excel file
-    # convert Series into DataFrame, if needed
-    if (isinstance(frame, pd.Series)):
-        frame = pd.DataFrame(frame)
-
-    frame.to_excel('./out/' + filename + '.xlsx', sheet_name=filename)
-
-
-def stents_plot_basic(data, groupby,
-                      dataslice=False, title='', color='m',
-                      figsize=(8, 6), xlabel='', ylabel='',
-                      integer=True, filename='figure.png'):
-    frame = data.groupby(groupby).size()
-    frame.sort(axis=0, ascending=False)
-    if (dataslice):
-        sliced_frame = frame[dataslice[0]:dataslice[1]]
-    else:
-        sliced_frame = frame
-    barh(frame=sliced_frame,
-         title=title, color=color, legend=False,
-         figsize=figsize, xlabel=xlabel, ylabel=ylabel,
-         integer=integer, filename=filename)
-
-
-def stents_plot_stacked(data, groupby, sortby,
-                        dataslice=False, title='', color='m',
-                        figsize=(8, 6), xlabel='', ylabel='',
-                        integer=True, filename='figure.png'):
-    frame = data.groupby(groupby).size()
-    unstacked_frame = frame.unstack()
-    unstacked_frame.fillna(value=0, inplace=True)
-    sorted_frame = unstacked_frame.sort_index(by=sortby, ascending=False)
-    if (dataslice):
-        sliced_frame = sorted_frame[dataslice[0]:dataslice[1]]
+import argparse
+import sys
+
+import instrument
+from artifacts import clean_outputs
+from dataset import mongo_chunks, read_chunks
+from instrument import stage
+from outputs import FORMATS, IMAGE_FORMATS, new_outputs
+from partition import PARTITIONS, run_partitioned
+from pushdown import PUSHDOWN_TASKS, mongo_pushdown
+from report import setup_pandas
+from significance import significance_tables
+from stream import stream_aggregate
+from tasks import TASK_NAMES, new_run, run_tasks
+from trend import DATES, FREQS, run_trend
+
+
+def draw_all(path='./in/st.csv', workers=1, chunksize=None, mongo=None,
+             cache=True, names=None, partition=None, pushdown=False,
+             resamples=0, seed=0, outputs=None):
+
+    # matplotlib is imported by the first chart drawn, if any
+    setup_pandas()
+    outputs = outputs or new_outputs()
+
+    if (partition):
+        return run_partitioned(path, partition, names, workers, cache,
+                               outputs)
+
+    known = None
+    if (pushdown):
+        names = names or PUSHDOWN_TASKS
+        known = mongo_pushdown(mongo, names)
+    elif (mongo):
+        with stage('stream'):
+            known = stream_aggregate(
+                mongo_chunks(mongo, chunksize=chunksize or 100000))
+    elif (chunksize):
+        with stage('stream'):
+            known = stream_aggregate(read_chunks(path, chunksize=chunksize))
+    run = new_run(path, names, known)
+    extra_tables = []
+    if (resamples):
+        extra_tables = significance_tables(run, resamples, seed, workers)
+    run_tasks(run, workers, cache, outputs=outputs,
+              extra_tables=extra_tables)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Draw stents report')
+    parser.add_argument('--input', default='./in/st.csv')
+    parser.add_argument('--tasks', default=None,
+                        help='comma separated tasks to run, e.g. 3a,14 '
+                             '(default: all of %s)' % ','.join(TASK_NAMES))
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes rendering charts')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='stream the export in chunks of this many rows '
+                             'instead of loading it into memory')
+    parser.add_argument('--mongo', default=None,
+                        help='stream the cards from this MongoDB url '
+                             'instead of reading the csv export')
+    parser.add_argument('--pushdown', action='store_true',
+                        help='let the --mongo server count and average, '
+                             'for the tasks that need nothing else (%s)' %
+                             ','.join(PUSHDOWN_TASKS))
+    parser.add_argument('--partition', choices=PARTITIONS, default=None,
+                        help='also write every task for each clinic, region '
+                             'or producer to out/<partition>/<name>/')
+    parser.add_argument('--significance', type=int, default=0,
+                        metavar='RESAMPLES',
+                        help='add bootstrap confidence intervals and '
+                             'permutation p-values from this many '
+                             'resamples as <task>_ci and <task>_p tables')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the resampling')
+    parser.add_argument('--formats', default='png,xlsx',
+                        help='comma separated outputs out of %s' %
+                             ','.join(FORMATS))
+    parser.add_argument('--data-only', action='store_true',
+                        help='write no images and do not load matplotlib')
+    parser.add_argument('--png-dpi', type=int, default=None)
+    parser.add_argument('--svg-dpi', type=int, default=None)
+    parser.add_argument('--excel-engine', default=None,
+                        help='pandas Excel engine, e.g. xlsxwriter')
+    parser.add_argument('--constant-memory', action='store_true',
+                        help='flush workbook rows as they are written '
+                             '(xlsxwriter)')
+    parser.add_argument('--trend', choices=sorted(FREQS), default=None,
+                        help='write counts of the count tasks and the '
+                             'length of stay per month or quarter to '
+                             'out/trend.xlsx instead of the report')
+    parser.add_argument('--trend-date', choices=DATES,
+                        default='hospitalization.startedAt')
+    parser.add_argument('--window', type=int, default=None,
+                        help='sum trends over this many periods')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='redraw charts even if they are up to date')
+    parser.add_argument('--clean', type=int, default=None, metavar='DAYS',
+                        help='remove charts not produced in the last DAYS '
+                             'days and exit')
+    parser.add_argument('--profile', default=None, metavar='JSON',
+                        help='record time and memory of every stage, save '
+                             'them to JSON and print a summary')
+    args = parser.parse_args()
+    names = args.tasks.split(',') if args.tasks else None
+    if (names and set(names) - set(TASK_NAMES)):
+        parser.error('unknown tasks: %s' %
+                     ','.join(sorted(set(names) - set(TASK_NAMES))))
+    if (args.pushdown and not args.mongo):
+        parser.error('--pushdown needs --mongo')
+    if (args.pushdown and names and set(names) - set(PUSHDOWN_TASKS)):
+        parser.error('tasks %s need the full export' %
+                     ','.join(sorted(set(names) - set(PUSHDOWN_TASKS))))
+    if (args.partition and (args.chunksize or args.mongo)):
+        parser.error('--partition needs the export loaded into memory')
+    if (args.significance and (args.chunksize or args.mongo or
+                               args.partition)):
+        parser.error('--significance needs the export loaded into memory')
+    formats = [fmt for fmt in args.formats.split(',') if fmt]
+    if (set(formats) - set(FORMATS)):
+        parser.error('unknown formats: %s' %
+                     ','.join(sorted(set(formats) - set(FORMATS))))
+    if (args.data_only):
+        formats = [fmt for fmt in formats if fmt not in IMAGE_FORMATS]
+    dpi = dict((fmt, getattr(args, fmt + '_dpi')) for fmt in IMAGE_FORMATS
+               if getattr(args, fmt + '_dpi'))
+    outputs = new_outputs(formats, dpi, args.excel_engine,
+                          args.constant_memory)
+    if (args.trend and (args.mongo or args.partition)):
+        parser.error('--trend reads the csv export')
+    if (args.clean is not None):
+        clean_outputs(args.clean)
     else:
-        sliced_frame = sorted_frame
-    barh(frame=sliced_frame,
-         title=title, color=color, legend=True,
-         figsize=figsize, xlabel=xlabel, ylabel=ylabel,
-         integer=integer, stacked=True, filename=filename)
-
-
-def draw_impressions_chart(people):
-    conductance = people['impressions.conductance'].value_counts()
-    conformability = people['impressions.conformability'].value_counts()
-    delivery = people['impressions.delivery'].value_counts()
-    flexibility = people['impressions.flexibility'].value_counts()
-    recoil = people['impressions.recoil'].value_counts()
-    overall = people['impressions.overall'].value_counts()
-    names = {
-        0: 'проводимость',
-        1: 'прилегаемость',
-        2: 'система доставки',
-        3: 'гибкость',
-        4: 'recoil',
-        5: 'общие впечатления'
-    }
-    impressions = pd.concat([conductance, conformability, delivery,
-                            flexibility, recoil, overall],
-                            axis=1)
-    impressions.rename(columns=names, inplace=True)
-    impressions.fillna(value=0, inplace=True)
-    barh(frame=impressions[1:].transpose(),
-         title=u'Впечатления от стентов', color='gryb', legend_loc=3,
-         figsize=(10, 10), xlabel=u'Количество процедур стентирования',
-         stacked=True, legend=True, hidevalue=20, filename='task16')
-
-
-def corr_task8(stents):
-    # Task 8
-    frame = stents[['hospitalization.diagnosis',
-                    'stents.segmentNo',
-                    'stents.tortuosityDeg',
-                    'stents.calcificationDeg']]
-    # Replace strings with categories
-    frame['hospitalization.diagnosis'] = pd.Categorical.from_array(
-        frame['hospitalization.diagnosis']).labels
-    frame['stents.tortuosityDeg'] = pd.Categorical.from_array(
-        frame['stents.tortuosityDeg']).labels
-    frame['stents.calcificationDeg'] = pd.Categorical.from_array(
-        frame['stents.calcificationDeg']).labels
-    names = {
-        'hospitalization.diagnosis': 'Диагноз',
-        'stents.segmentNo': 'Номер сегмента',
-        'stents.tortuosityDeg': 'Извитость',
-        'stents.calcificationDeg': 'Кальциноз'
-    }
-    frame.rename(columns=names, inplace=True)
-    corr = frame.corr()
-    corr.to_excel('./out/task8.xlsx', sheet_name='task8')
-
-
-def corr_task13(stents):
-    # Task 13
-    frame = stents[['stents.stent.len',
-                    'stents.stent.dia',
-                    'stents.segmentNo',
-                    'stents.stenosisType',
-                    'stents.tortuosityDeg',
-                    'stents.calcificationDeg']]
-    # Replace strings with categories
-    frame['stents.stenosisType'] = pd.Categorical.from_array(
-        frame['stents.stenosisType']).labels
-    frame['stents.tortuosityDeg'] = pd.Categorical.from_array(
-        frame['stents.tortuosityDeg']).labels
-    frame['stents.calcificationDeg'] = pd.Categorical.from_array(
-        frame['stents.calcificationDeg']).labels
-    avg_len = frame['stents.stent.len'].mean()
-    avg_dia = frame['stents.stent.dia'].mean()
-    names = {
-        'stents.stent.len': 'Длина стента',
-        'stents.stent.dia': 'Диаметр стента',
-        'stents.stenosisType': 'Тип стеноза',
-        'stents.segmentNo': 'Номер сегмента',
-        'stents.tortuosityDeg': 'Извитость',
-        'stents.calcificationDeg': 'Кальциноз'
-    }
-    frame.rename(columns=names, inplace=True)
-    corr = frame.corr()
-    print('Средняя длина стента:   %.2f мм' % avg_len)
-    print('Средний диаметр стента: %.2f мм\n' % avg_dia)
-    corr.to_excel('./out/task13.xlsx', sheet_name='task13')
-
-
-def corr_task14(stents):
-    # Task 14
-    frame = stents[['patient.sex',
-                    'patient.age',
-                    'hospitalization.diagnosis',
-                    'stents.stenosisType',
-                    'stents.segmentNo',
-                    'stents.tortuosityDeg',
-                    'stents.calcificationDeg',
-                    'stents.hResults.success',
-                    'stents.hResults.replaced',
-                    'stents.predilatation',
-                    'stents.postdilatation',
-                    'stents.stent.type']]
-    # Replace strings with categories
-    frame['patient.sex'] = pd.Categorical.from_array(
-        frame['patient.sex']).labels
-    frame['hospitalization.diagnosis'] = pd.Categorical.from_array(
-        frame['hospitalization.diagnosis']).labels
-    frame['stents.stenosisType'] = pd.Categorical.from_array(
-        frame['stents.stenosisType']).labels
-    frame['stents.tortuosityDeg'] = pd.Categorical.from_array(
-        frame['stents.tortuosityDeg']).labels
-    frame['stents.calcificationDeg'] = pd.Categorical.from_array(
-        frame['stents.calcificationDeg']).labels
-    frame['stents.hResults.success'] = pd.Categorical.from_array(
-        frame['stents.hResults.success']).labels
-    frame['stents.hResults.replaced'] = pd.Categorical.from_array(
-        frame['stents.hResults.replaced']).labels
-    frame['stents.predilatation'] = pd.Categorical.from_array(
-        frame['stents.predilatation']).labels
-    frame['stents.postdilatation'] = pd.Categorical.from_array(
-        frame['stents.postdilatation']).labels
-    frame['stents.stent.type'] = pd.Categorical.from_array(
-        frame['stents.stent.type']).labels
-    names = {
-        'patient.sex': 'Пол',
-        'patient.age': 'Возраст',
-        'hospitalization.diagnosis': 'Диагноз',
-        'stents.stenosisType': 'Тип стеноза',
-        'stents.segmentNo': 'Номер сегмента',
-        'stents.tortuosityDeg': 'Извитость',
-        'stents.calcificationDeg': 'Кальциноз',
-        'stents.hResults.success': 'Процедура успешна',
-        'stents.hResults.replaced': 'Замена стента',
-        'stents.predilatation': 'Предилятация',
-        'stents.postdilatation': 'Постдилятация',
-        'stents.stent.type': 'Тип стента'
-    }
-    frame.rename(columns=names, inplace=True)
-    corr = frame.corr()
-    corr.to_excel('./out/task14.xlsx', sheet_name='task14')
-
-
-def corr_task15(stents):
-    # Task 15
-    frame = stents[['stents.rResults.problems',
-                    'patient.sex',
-                    'patient.age',
-                    'hospitalization.diagnosis',
-                    'stents.stenosisType',
-                    'stents.segmentNo',
-                    'stents.tortuosityDeg',
-                    'stents.calcificationDeg',
-                    'stents.hResults.success',
-                    'stents.hResults.replaced',
-                    'stents.predilatation',
-                    'stents.postdilatation',
-                    'stents.stent.type']]
-    # Replace strings with categories
-    frame['stents.rResults.problems'] = pd.Categorical.from_array(
-        frame['stents.rResults.problems']).labels
-    frame['patient.sex'] = pd.Categorical.from_array(
-        frame['patient.sex']).labels
-    frame['hospitalization.diagnosis'] = pd.Categorical.from_array(
-        frame['hospitalization.diagnosis']).labels
-    frame['stents.stenosisType'] = pd.Categorical.from_array(
-        frame['stents.stenosisType']).labels
-    frame['stents.tortuosityDeg'] = pd.Categorical.from_array(
-        frame['stents.tortuosityDeg']).labels
-    frame['stents.calcificationDeg'] = pd.Categorical.from_array(
-        frame['stents.calcificationDeg']).labels
-    frame['stents.hResults.success'] = pd.Categorical.from_array(
-        frame['stents.hResults.success']).labels
-    frame['stents.hResults.replaced'] = pd.Categorical.from_array(
-        frame['stents.hResults.replaced']).labels
-    frame['stents.predilatation'] = pd.Categorical.from_array(
-        frame['stents.predilatation']).labels
-    frame['stents.postdilatation'] = pd.Categorical.from_array(
-        frame['stents.postdilatation']).labels
-    frame['stents.stent.type'] = pd.Categorical.from_array(
-        frame['stents.stent.type']).labels
-    names = {
-        'stents.rResults.problems': 'Отд. осложнения',
-        'patient.sex': 'Пол',
-        'patient.age': 'Возраст',
-        'hospitalization.diagnosis': 'Диагноз',
-        'stents.stenosisType': 'Тип стеноза',
-        'stents.segmentNo': 'Номер сегмента',
-        'stents.tortuosityDeg': 'Извитость',
-        'stents.calcificationDeg': 'Кальциноз',
-        'stents.hResults.success': 'Процедура успешна',
-        'stents.hResults.replaced': 'Замена стента',
-        'stents.predilatation': 'Предилятация',
-        'stents.postdilatation': 'Постдилятация',
-        'stents.stent.type': 'Тип стента'
-    }
-    frame.rename(columns=names, inplace=True)
-    corr = frame.corr()
-    corr.to_excel('./out/task15.xlsx', sheet_name='task15')
-
-
-def draw_all():
-
-    mpl.rcParams['font.family'] = 'fantasy'
-    mpl.rcParams['font.fantasy'] = 'Arial'
-    pd.options.mode.chained_assignment = None
-
-    path = './in/st.csv'
-    stents = pd.read_csv(path, index_col=1, encoding='UTF-8', sep=',')
-    people = stents.groupby(level=0).first()
-
-    # 1. Пол
-    gender = people['patient.sex'].value_counts()
-    barh(frame=gender, title=u'Пол пациентов', color='gb',
-         xlabel=u'Количество пациентов', filename='task1')
-
-    # 2. Средний возраст
-    mean_age = people.groupby('patient.sex').mean()['patient.age']
-    barh(frame=mean_age, title=u'Средний возраст пациентов', color='bg',
-         xlabel=u'Возраст', filename='task2')
-
-    # 3. Диагноз
-    stents_plot_basic(data=stents,
-                      groupby='hospitalization.diagnosis',
-                      dataslice=(0, 10),
-                      title=u'Диагноз', color='m',
-                      xlabel=u'Количество пациентов',
-                      filename='task3a')
-
-    stents_plot_stacked(data=stents,
-                        groupby=['hospitalization.diagnosis', 'patient.sex'],
-                        sortby=u'муж.',
-                        dataslice=(0, 10), figsize=(14, 10),
-                        title=u'Распределение диагнозов по полам',
-                        color='bg',
-                        xlabel=u'Количество пациентов',
-                        filename='task3b')
-
-    # 4. Локализация стеноза
-    stents_plot_basic(data=stents,
-                      groupby='stents.segmentNo',
-                      title=u'Локализация стеноза',
-                      color='m',
-                      xlabel=u'Количество установленных стентов',
-                      ylabel=u'Номер сегмента',
-                      filename='task4a')
-
-    stents_plot_stacked(data=stents,
-                        groupby=['stents.segmentNo', 'patient.sex'],
-                        sortby=u'муж.',
-                        title=u'Распределение локализации стеноза по полам',
-                        color='bg', figsize=(14, 10),
-                        xlabel='Количество установленных стентов',
-                        ylabel=u'Номер сегмента',
-                        filename='task4b')
-
-    # 5. Тип стеноза
-    stents_plot_basic(data=stents, groupby='stents.stenosisType',
-                      title=u'Типы стеноза', color='m',
-                      xlabel=u'Количество установленных стентов',
-                      ylabel=u'Тип стеноза',
-                      filename='task5a')
-    stents_plot_stacked(data=stents,
-                        groupby=['stents.stenosisType', 'patient.sex'],
-                        sortby=u'муж.',
-                        title=u'Распределение типов стеноза по полам',
-                        color='bg',
-                        xlabel='Количество установленных стентов',
-                        ylabel=u'Тип стеноза',
-                        filename='task5b')
-    # 6. Извитость
-    stents_plot_basic(data=stents,
-                      groupby='stents.tortuosityDeg',
-                      dataslice=(0, 10),
-                      title=u'Извитость', color='m',
-                      xlabel='Количество пациентов',
-                      ylabel='Степень извитости',
-                      filename='task6')
-    # 7. Кальциноз
-    stents_plot_basic(data=stents,
-                      groupby='stents.tortuosityDeg',
-                      dataslice=(0, 10),
-                      title=u'Кальциноз', color='m',
-                      xlabel='Количество пациентов',
-                      ylabel='Степень кальциноза',
-                      filename='task7')
-    # 8. Корреляция с пунктов 3,4, и 7,6
-    corr_task8(stents)
-    print('\n')
-    # 9. Количество успешных процедур
-    frame = stents['stents.hResults.success'].value_counts()
-    barh(frame=frame, title=u'Результат процедуры', color='gr',
-         xlabel='Количество процедур стентирования',
-         filename='task9')
-    # 10. Ситуации когда пришлось использовать другой стент
-    frame = stents['stents.hResults.replaced'].value_counts()
-    barh(frame=frame, title=u'Замена стента', color='gr',
-         xlabel='Количество процедур стентирования',
-         filename='task10')
-    # 11а. Предилятация
-    frame = stents['stents.predilatation'].value_counts()
-    barh(frame=frame, title=u'Предилятация', color='gc',
-         xlabel='Количество процедур стентирования',
-         filename='task11a')
-    # 11б. Постдилятация
-    frame = stents['stents.postdilatation'].value_counts()
-    barh(frame=frame, title=u'Постдилятация', color='gc',
-         xlabel='Количество процедур стентирования',
-         filename='task11b')
-    # 12. Стенты  сталь/кобальт хром/покрытые
-    frame = stents['stents.stent.type'].value_counts()
-    barh(frame=frame, title=u'Тип стента', color='gc',
-         xlabel='Количество процедур стентирования',
-         filename='task12')
-    # 13. Средняя длина стентов и диаметр – корреляция с пунктами 4,5,6,7
-    corr_task13(stents)
-    print('\n')
-    # 14. Госпитальные результаты по анкете и корреляция с предыдущими
-    # пунктами 1-7 и 9-12
-    corr_task14(stents)
-    print('\n')
-    # 15. Отдаленные результаты по пунктам в анкете ( %) и связь
-    # с остальными факторами.
-    corr_task15(stents)
-    print('\n')
-    # 16. Общие впечатления: суммарно для учреждений и общие
-    draw_impressions_chart(people)
-
-
-draw_all()
+        instrument.enable(args.profile is not None)
+        failed = None
+        if (args.trend):
+            run_trend(args.input, names, args.trend, args.trend_date,
+                      args.window, args.chunksize, outputs)
+        else:
+            failed = draw_all(args.input, args.workers, args.chunksize,
+                              args.mongo, not args.no_cache, names,
+                              args.partition, args.pushdown,
+                              args.significance, args.seed, outputs)
+        if (args.profile):
+            instrument.write_json(args.profile)
+            instrument.print_summary()
+        if (failed):
+            sys.exit(1)
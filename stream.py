@@ -0,0 +1,231 @@
+import numpy as np
+import pandas as pd
+
+from corr import corr_columns, cramers_v, is_categorical
+from cube import PEOPLE_DIMS, STENT_DIMS, build_cube, merge_cubes
+from schema import DTYPES
+
+
+# Out-of-core version of the intermediates in tasks.NODES: every
+# statistic is kept as a mergeable summary that is updated chunk by
+# chunk, so memory does not grow with the number of stents.
+
+
+def pair_moments(matrix):
+    # Per column pair (i, j), over the rows where both are present:
+    # count, mean of column i, sum of squared deviations of column i
+    # and co-moment of i and j.
+    mask = ~np.isnan(matrix)
+    m = mask.astype(np.float64)
+    # shift by the first present value of every column to keep the
+    # sums small
+    shift = np.zeros(matrix.shape[1])
+    if (len(matrix)):
+        first = np.argmax(mask, axis=0)
+        shift = np.nan_to_num(matrix[first, np.arange(matrix.shape[1])])
+    centered = np.where(mask, matrix - shift, 0.0)
+    n = m.T.dot(m)
+    sx = centered.T.dot(m)
+    sxx = (centered ** 2).T.dot(m)
+    sxy = centered.T.dot(centered)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(n > 0, sx / n, 0.0)
+        m2 = np.where(n > 0, sxx - sx * mean, 0.0)
+        c = np.where(n > 0, sxy - sx * mean.T, 0.0)
+    return {'n': n, 'mean': mean + shift[:, np.newaxis], 'm2': m2, 'c': c}
+
+
+def merge_moments(a, b):
+    # Chan et al. parallel update of counts, means and (co-)moments
+    if (a is None):
+        return b
+    n = a['n'] + b['n']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(n > 0, a['n'] * b['n'] / n, 0.0)
+        delta = b['mean'] - a['mean']
+        mean = np.where(n > 0, a['mean'] + delta * b['n'] / n, 0.0)
+    return {'n': n, 'mean': mean,
+            'm2': a['m2'] + b['m2'] + delta ** 2 * weight,
+            'c': a['c'] + b['c'] + delta * delta.T * weight}
+
+
+def group_moments(frame, by, column):
+    # count, mean and sum of squared deviations of column per category
+    data = frame[[by, column]].dropna()
+    # float32 columns would be averaged in float32 otherwise
+    grouped = data[column].astype(np.float64).groupby(data[by])
+    n = grouped.count().astype(np.float64)
+    return pd.DataFrame({'n': n, 'mean': grouped.mean(),
+                         'm2': grouped.var(ddof=0).fillna(0) * n})
+
+
+def merge_group_moments(a, b):
+    if (a is None):
+        return b
+    index = a.index.union(b.index)
+    a = a.reindex(index).fillna(0)
+    b = b.reindex(index).fillna(0)
+    n = a['n'] + b['n']
+    delta = b['mean'] - a['mean']
+    return pd.DataFrame({'n': n,
+                         'mean': a['mean'] + delta * b['n'] / n,
+                         'm2': a['m2'] + b['m2'] +
+                         delta ** 2 * a['n'] * b['n'] / n})
+
+
+def merge_counts(a, b):
+    if (a is None):
+        return b
+    return a.add(b, fill_value=0)
+
+
+def update_corr(state, chunk):
+    columns = state['columns']
+    numeric = [c for c in columns if not is_categorical(c)]
+    categorical = [c for c in columns if is_categorical(c)]
+
+    matrix = np.asarray(chunk[numeric], dtype=np.float64)
+    state['numeric'] = merge_moments(state.get('numeric'),
+                                     pair_moments(matrix))
+    for a in categorical:
+        key = (a, a)
+        state[key] = merge_counts(state.get(key), chunk[a].value_counts())
+        for b in categorical:
+            if (columns.index(b) > columns.index(a)):
+                key = (a, b)
+                state[key] = merge_counts(state.get(key),
+                                          chunk.groupby([a, b]).size())
+        for b in numeric:
+            key = (a, b)
+            state[key] = merge_group_moments(state.get(key),
+                                             group_moments(chunk, a, b))
+
+
+def table_stats(x, y, n_xy, m2_y=None):
+    # Pearson r between codes from a table of counts n_xy; for a
+    # category against a number, y holds per-category means and m2_y
+    # the within-category sums of squared deviations
+    n = n_xy.sum()
+    if (n < 2):
+        return np.nan, 0.0
+    mx = (x * n_xy).sum() / n
+    my = (y * n_xy).sum() / n
+    m2x = ((x - mx) ** 2 * n_xy).sum()
+    m2y = ((y - my) ** 2 * n_xy).sum()
+    if (m2_y is not None):
+        m2y += m2_y.sum()
+    c = ((x - mx) * (y - my) * n_xy).sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return c / np.sqrt(m2x * m2y), m2y
+
+
+def finish_corr(state):
+    # same result as corr.build_correlations() on the whole table
+    columns = state['columns']
+    numeric = [c for c in columns if not is_categorical(c)]
+    k = len(columns)
+    corr = np.full((k, k), np.nan)
+    assoc = np.full((k, k), np.nan)
+
+    moments = state['numeric']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = moments['c'] / np.sqrt(moments['m2'] * moments['m2'].T)
+    r[moments['n'] < 2] = np.nan
+    index = [columns.index(c) for c in numeric]
+    corr[np.ix_(index, index)] = r
+    assoc[np.ix_(index, index)] = np.abs(r)
+
+    # categories are coded in sorted order, like pd.Categorical does
+    categories = {}
+    for c in columns:
+        if (is_categorical(c)):
+            categories[c] = state[(c, c)].index.sort_values()
+
+    for i, a in enumerate(columns):
+        if (not is_categorical(a)):
+            continue
+        for j, b in enumerate(columns):
+            if (j < i and is_categorical(b)):
+                continue
+            if (a == b):
+                counts = state[(a, a)].reindex(categories[a]).values
+                table = np.diag(counts.astype(np.float64))
+            elif (is_categorical(b)):
+                counts = state[(a, b)]
+                table = np.zeros((len(categories[a]), len(categories[b])))
+                table[categories[a].get_indexer(
+                          counts.index.get_level_values(0)),
+                      categories[b].get_indexer(
+                          counts.index.get_level_values(1))] = counts.values
+            else:
+                groups = state[(a, b)]
+                x = categories[a].get_indexer(groups.index).astype(float)
+                r, m2y = table_stats(x, groups['mean'].values,
+                                     groups['n'].values,
+                                     m2_y=groups['m2'].values)
+                # correlation ratio: explained share of the variance
+                between = m2y - groups['m2'].values.sum()
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    eta = np.sqrt(between / m2y) \
+                        if groups['n'].sum() and m2y else np.nan
+                corr[i, j] = corr[j, i] = r
+                assoc[i, j] = assoc[j, i] = eta
+                continue
+            x, y = np.indices(table.shape)
+            r, m2y = table_stats(x, y, table)
+            corr[i, j] = corr[j, i] = r
+            assoc[i, j] = assoc[j, i] = cramers_v(table)
+    return {'columns': columns, 'corr': corr, 'assoc': assoc}
+
+
+def cast_int_levels(cube):
+    # chunks without missing values parse integer columns as int and
+    # chunks with them as float; restore int levels when the merged
+    # column has no missing values, as the cached table would
+    for i, dim in enumerate(cube['dims']):
+        missing = cube['coords'][i] == len(cube['levels'][i])
+        if (DTYPES[dim].startswith('int') and
+                not cube['counts'][missing].any()):
+            cube['levels'][i] = cube['levels'][i].astype(np.int64)
+    return cube
+
+
+def stream_aggregate(chunks):
+    stents_cube = None
+    people_cube = None
+    age = None
+    sizes = None
+    correlations = {'columns': corr_columns()}
+    seen = set()
+    rows = 0
+
+    for chunk in chunks:
+        rows += len(chunk)
+        stents_cube = merge_cubes(stents_cube, build_cube(chunk, STENT_DIMS))
+        update_corr(correlations, chunk)
+        sizes = merge_counts(sizes, pd.DataFrame(
+            {'sum': chunk[['stents.stent.len', 'stents.stent.dia']].sum(),
+             'count': chunk[['stents.stent.len',
+                             'stents.stent.dia']].count()}))
+
+        # first seen row of every patient
+        people = chunk.groupby(level=0).first()
+        people = people[np.array([p not in seen for p in people.index],
+                                 dtype=bool)]
+        seen.update(people.index)
+        people_cube = merge_cubes(people_cube,
+                                  build_cube(people, PEOPLE_DIMS))
+        age = merge_counts(age, people.groupby('patient.sex')[
+            'patient.age'].agg(['sum', 'count']))
+
+    mean_age = (age['sum'] / age['count'].replace(0, np.nan)).dropna()
+    mean_age.name = 'patient.age'
+    mean_age.index.name = 'patient.sex'
+    mean_size = sizes['sum'] / sizes['count']
+    print('Streamed %d rows, %d patients' % (rows, len(seen)))
+    return {'stents_cube': cast_int_levels(stents_cube),
+            'people_cube': cast_int_levels(people_cube),
+            'mean_age': mean_age,
+            'stent_size': (mean_size['stents.stent.len'],
+                           mean_size['stents.stent.dia']),
+            'correlations': finish_corr(correlations)}
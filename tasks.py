@@ -0,0 +1,286 @@
+from artifacts import OUT_DIR
+from corr import build_correlations, corr_tables, print_mean_stent_size
+from cube import PEOPLE_DIMS, STENT_DIMS, build_cube, cube_value_counts
+from dataset import load_stents
+from instrument import stage
+from outputs import OUTPUTS, write_tables
+from report import chart, impressions_chart, render_all, \
+    stents_chart_basic, stents_chart_stacked
+from schema import columns_for
+
+
+# Report tasks, in report order. Every task names the intermediates it
+# reads ('inputs'), how its output is built ('kind') and the chart
+# options passed to barh(); correlation tasks write their workbooks
+# directly.
+TASKS = [
+    # 1. Пол
+    {'name': '1', 'kind': 'counts', 'inputs': ['people_cube'],
+     'column': 'patient.sex',
+     'chart': dict(title=u'Пол пациентов', color='gb',
+                   xlabel=u'Количество пациентов', filename='task1')},
+    # 2. Средний возраст
+    {'name': '2', 'kind': 'series', 'inputs': ['mean_age'],
+     'chart': dict(title=u'Средний возраст пациентов', color='bg',
+                   xlabel=u'Возраст', filename='task2')},
+    # 3. Диагноз
+    {'name': '3a', 'kind': 'basic', 'inputs': ['stents_cube'],
+     'groupby': 'hospitalization.diagnosis',
+     'chart': dict(dataslice=(0, 10),
+                   title=u'Диагноз', color='m',
+                   xlabel=u'Количество пациентов',
+                   filename='task3a')},
+    {'name': '3b', 'kind': 'stacked', 'inputs': ['stents_cube'],
+     'groupby': ['hospitalization.diagnosis', 'patient.sex'],
+     'chart': dict(sortby=u'муж.',
+                   dataslice=(0, 10), figsize=(14, 10),
+                   title=u'Распределение диагнозов по полам',
+                   color='bg',
+                   xlabel=u'Количество пациентов',
+                   filename='task3b')},
+    # 4. Локализация стеноза
+    {'name': '4a', 'kind': 'basic', 'inputs': ['stents_cube'],
+     'groupby': 'stents.segmentNo',
+     'chart': dict(title=u'Локализация стеноза',
+                   color='m',
+                   xlabel=u'Количество установленных стентов',
+                   ylabel=u'Номер сегмента',
+                   filename='task4a')},
+    {'name': '4b', 'kind': 'stacked', 'inputs': ['stents_cube'],
+     'groupby': ['stents.segmentNo', 'patient.sex'],
+     'chart': dict(sortby=u'муж.',
+                   title=u'Распределение локализации стеноза по полам',
+                   color='bg', figsize=(14, 10),
+                   xlabel='Количество установленных стентов',
+                   ylabel=u'Номер сегмента',
+                   filename='task4b')},
+    # 5. Тип стеноза
+    {'name': '5a', 'kind': 'basic', 'inputs': ['stents_cube'],
+     'groupby': 'stents.stenosisType',
+     'chart': dict(title=u'Типы стеноза', color='m',
+                   xlabel=u'Количество установленных стентов',
+                   ylabel=u'Тип стеноза',
+                   filename='task5a')},
+    {'name': '5b', 'kind': 'stacked', 'inputs': ['stents_cube'],
+     'groupby': ['stents.stenosisType', 'patient.sex'],
+     'chart': dict(sortby=u'муж.',
+                   title=u'Распределение типов стеноза по полам',
+                   color='bg',
+                   xlabel='Количество установленных стентов',
+                   ylabel=u'Тип стеноза',
+                   filename='task5b')},
+    # 6. Извитость
+    {'name': '6', 'kind': 'basic', 'inputs': ['stents_cube'],
+     'groupby': 'stents.tortuosityDeg',
+     'chart': dict(dataslice=(0, 10),
+                   title=u'Извитость', color='m',
+                   xlabel='Количество пациентов',
+                   ylabel='Степень извитости',
+                   filename='task6')},
+    # 7. Кальциноз
+    {'name': '7', 'kind': 'basic', 'inputs': ['stents_cube'],
+     'groupby': 'stents.tortuosityDeg',
+     'chart': dict(dataslice=(0, 10),
+                   title=u'Кальциноз', color='m',
+                   xlabel='Количество пациентов',
+                   ylabel='Степень кальциноза',
+                   filename='task7')},
+    # 8. Корреляция с пунктов 3,4, и 7,6
+    {'name': '8', 'kind': 'corr', 'inputs': ['correlations'],
+     'output': 'task8'},
+    # 9. Количество успешных процедур
+    {'name': '9', 'kind': 'counts', 'inputs': ['stents_cube'],
+     'column': 'stents.hResults.success',
+     'chart': dict(title=u'Результат процедуры', color='gr',
+                   xlabel='Количество процедур стентирования',
+                   filename='task9')},
+    # 10. Ситуации когда пришлось использовать другой стент
+    {'name': '10', 'kind': 'counts', 'inputs': ['stents_cube'],
+     'column': 'stents.hResults.replaced',
+     'chart': dict(title=u'Замена стента', color='gr',
+                   xlabel='Количество процедур стентирования',
+                   filename='task10')},
+    # 11а. Предилятация
+    {'name': '11a', 'kind': 'counts', 'inputs': ['stents_cube'],
+     'column': 'stents.predilatation',
+     'chart': dict(title=u'Предилятация', color='gc',
+                   xlabel='Количество процедур стентирования',
+                   filename='task11a')},
+    # 11б. Постдилятация
+    {'name': '11b', 'kind': 'counts', 'inputs': ['stents_cube'],
+     'column': 'stents.postdilatation',
+     'chart': dict(title=u'Постдилятация', color='gc',
+                   xlabel='Количество процедур стентирования',
+                   filename='task11b')},
+    # 12. Стенты  сталь/кобальт хром/покрытые
+    {'name': '12', 'kind': 'counts', 'inputs': ['stents_cube'],
+     'column': 'stents.stent.type',
+     'chart': dict(title=u'Тип стента', color='gc',
+                   xlabel='Количество процедур стентирования',
+                   filename='task12')},
+    # 13. Средняя длина стентов и диаметр – корреляция с пунктами 4,5,6,7
+    {'name': '13', 'kind': 'corr', 'inputs': ['stent_size', 'correlations'],
+     'output': 'task13'},
+    # 14. Госпитальные результаты по анкете и корреляция с предыдущими
+    # пунктами 1-7 и 9-12
+    {'name': '14', 'kind': 'corr', 'inputs': ['correlations'],
+     'output': 'task14'},
+    # 15. Отдаленные результаты по пунктам в анкете ( %) и связь
+    # с остальными факторами.
+    {'name': '15', 'kind': 'corr', 'inputs': ['correlations'],
+     'output': 'task15'},
+    # 16. Общие впечатления: суммарно для учреждений и общие
+    {'name': '16', 'kind': 'impressions', 'inputs': ['people_cube']},
+]
+
+TASK_NAMES = [task['name'] for task in TASKS]
+
+
+def select_tasks(names=None):
+    if (names is None):
+        return list(TASKS)
+    unknown = set(names) - set(TASK_NAMES)
+    if (unknown):
+        raise ValueError('unknown tasks: %s' % ', '.join(sorted(unknown)))
+    return [task for task in TASKS if task['name'] in names]
+
+
+# Shared intermediates: name -> (intermediates it depends on, function
+# of the run and the dependencies). Together with the task inputs they
+# form the DAG that compute() walks.
+
+def load_node(run):
+    return load_stents(run['path'], columns_for(run['names']),
+                       verbose=True)
+
+
+def people_node(run, stents):
+    return stents.groupby(level=0).first()
+
+
+def present(frame, dims):
+    # the loaded columns depend on the selected tasks
+    return [dim for dim in dims if dim in frame.columns]
+
+
+def stents_cube_node(run, stents):
+    return build_cube(stents, present(stents, STENT_DIMS))
+
+
+def people_cube_node(run, people):
+    return build_cube(people, present(people, PEOPLE_DIMS))
+
+
+def mean_age_node(run, people):
+    # a part of the registry keeps every sex as a category, but has no
+    # mean for the ones it lacks
+    return people.groupby('patient.sex').mean()['patient.age'].dropna()
+
+
+def stent_size_node(run, stents):
+    return (stents['stents.stent.len'].mean(),
+            stents['stents.stent.dia'].mean())
+
+
+def correlations_node(run, stents):
+    tasks = [task['output'] for task in run['tasks']
+             if task['kind'] == 'corr']
+    return build_correlations(stents, tasks)
+
+
+NODES = {
+    'stents': ([], load_node),
+    'people': (['stents'], people_node),
+    'stents_cube': (['stents'], stents_cube_node),
+    'people_cube': (['people'], people_cube_node),
+    'mean_age': (['people'], mean_age_node),
+    'stent_size': (['stents'], stent_size_node),
+    'correlations': (['stents'], correlations_node),
+}
+
+
+def new_run(path='./in/st.csv', names=None, known=None):
+    # known: intermediates computed elsewhere, e.g. by stream.py
+    tasks = select_tasks(names)
+    return {'path': path,
+            'tasks': tasks,
+            'names': [task['name'] for task in tasks],
+            'values': dict(known or {})}
+
+
+def rows(value):
+    # rows of a frame or series and occupied cells of a cube, for the
+    # profile; None for anything else
+    if (isinstance(value, dict)):
+        return len(value['counts']) if 'counts' in value else None
+    return len(value) if hasattr(value, 'shape') else None
+
+
+def compute(run, name):
+    # lazily evaluate an intermediate, at most once per run
+    values = run['values']
+    if (name not in values):
+        deps, function = NODES[name]
+        args = [compute(run, dep) for dep in deps]
+        sizes = [rows(arg) for arg in args]
+        rows_in = sum(sizes) if sizes and None not in sizes else None
+        with stage(name, rows_in=rows_in) as s:
+            values[name] = function(run, *args)
+            s.rows_out = rows(values[name])
+    return values[name]
+
+
+def build_chart(run, task):
+    kind = task['kind']
+    source = compute(run, task['inputs'][0])
+    if (kind == 'counts'):
+        return chart(cube_value_counts(source, task['column']),
+                     **task['chart'])
+    if (kind == 'series'):
+        return chart(source, **task['chart'])
+    if (kind == 'basic'):
+        return stents_chart_basic(source, task['groupby'], **task['chart'])
+    if (kind == 'stacked'):
+        return stents_chart_stacked(source, task['groupby'],
+                                    **task['chart'])
+    if (kind == 'impressions'):
+        return impressions_chart(source)
+    raise ValueError('task %s has no chart' % task['name'])
+
+
+def build_charts(run):
+    # charts are only aggregated here and rendered in one go later
+    with stage('charts') as s:
+        charts = [build_chart(run, task) for task in run['tasks']
+                  if task['kind'] != 'corr']
+        s.rows_out = len(charts)
+    return charts
+
+
+def task_tables(run, charts):
+    # the table behind every task, in report order: the frame of each
+    # chart and the sheets of each correlation task
+    tables = []
+    charts = iter(charts)
+    for task in run['tasks']:
+        if (task['kind'] != 'corr'):
+            frame, options = next(charts)
+            tables.append((options['filename'], frame))
+            continue
+        if ('stent_size' in task['inputs']):
+            print_mean_stent_size(*compute(run, 'stent_size'))
+        tables.extend(corr_tables(compute(run, 'correlations'),
+                                  task['output']))
+        print('\n')
+    return tables
+
+
+def run_tasks(run, workers=1, cache=True, out_dir=OUT_DIR,
+              outputs=OUTPUTS, extra_tables=()):
+    # extra_tables: (sheet, frame) written after the task tables, e.g.
+    # the significance tables
+    charts = build_charts(run)
+    write_tables(task_tables(run, charts) + list(extra_tables), outputs,
+                 out_dir)
+    if (outputs['images']):
+        render_all(charts, workers, cache, out_dir, outputs['images'])
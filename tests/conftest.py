@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True, scope='session')
+def repo_dir():
+    # the scripts read in/fields.txt and in/st.csv relative to the
+    # working directory
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    yield ROOT
+    os.chdir(cwd)
+
+
+@pytest.fixture(scope='session')
+def stents(repo_dir, tmp_path_factory):
+    # typed in/st.csv, cached outside of the repository
+    from dataset import load_stents
+    return load_stents('./in/st.csv',
+                       cache_dir=str(tmp_path_factory.mktemp('cache')))
+
+
+def counts(cube, groupby):
+    # cells of a cube as plain values, to compare cubes built differently
+    from cube import cube_counts
+    series = cube_counts(cube, groupby)
+    return dict((str(key), int(value)) for key, value in series.items())
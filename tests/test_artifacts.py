@@ -0,0 +1,35 @@
+import os
+
+import pandas as pd
+
+from artifacts import clean_outputs, load_manifest
+from report import chart, render_all
+
+
+IMAGES = {'png': 10}
+
+
+def jobs(*names):
+    return [chart(pd.Series([3, 2], index=['a', 'b']), color='m',
+                  filename=name)
+            for name in names]
+
+
+def test_forced_runs_keep_the_manifest(tmp_path):
+    out_dir = str(tmp_path)
+    assert render_all(jobs('t1', 't2'), out_dir=out_dir,
+                      images=IMAGES) == ['t1', 't2']
+    assert render_all(jobs('t1', 't2'), out_dir=out_dir,
+                      images=IMAGES) == []
+    # a forced run of a subset draws it again and forgets nothing
+    assert render_all(jobs('t2'), cache=False, out_dir=out_dir,
+                      images=IMAGES) == ['t2']
+    assert sorted(load_manifest(out_dir)) == ['t1', 't2']
+
+    os.makedirs(os.path.join(out_dir, 'clinic', 'x'))
+    render_all(jobs('t3'), out_dir=os.path.join(out_dir, 'clinic', 'x'),
+               images=IMAGES)
+    clean_outputs(-1, out_dir)
+    assert sorted(os.listdir(out_dir)) == ['clinic', 'manifest.json']
+    assert os.listdir(os.path.join(out_dir, 'clinic', 'x')) == [
+        'manifest.json']
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from corr import association, corr_columns, encode, is_categorical, \
+    pairwise_corr
+
+
+@pytest.fixture(scope='module')
+def encoded(stents):
+    columns = corr_columns()
+    matrix, levels = encode(stents, columns)
+    return matrix, columns, levels
+
+
+def subsets(matrix, columns):
+    # the whole table, the few rows with long-term complications, where
+    # many columns are constant on the rows they share, and a small head
+    problems = ~np.isnan(matrix[:, columns.index('stents.rResults.problems')])
+    return [matrix, matrix[problems], matrix[:50]]
+
+
+def test_pairwise_corr_matches_pandas(encoded):
+    matrix, columns, levels = encoded
+    for part in subsets(matrix, columns):
+        expected = pd.DataFrame(part).corr().values
+        # pairs without a correlation besides the ones with themselves
+        assert np.isnan(expected).any()
+        np.testing.assert_allclose(pairwise_corr(part), expected,
+                                   rtol=1e-9, atol=1e-12, equal_nan=True)
+
+
+def cramers_v(x, y):
+    table = pd.crosstab(x, y).values.astype(np.float64)
+    n = table.sum()
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / n
+    chi2 = ((table - expected) ** 2 / expected).sum()
+    return np.sqrt(chi2 / n / (min(table.shape) - 1))
+
+
+def test_association_matches_pandas(encoded):
+    matrix, columns, levels = encoded
+    frame = pd.DataFrame(matrix, columns=columns)
+    result = association(matrix, columns, levels)
+    numbers = [c for c in columns if not is_categorical(c)]
+    np.testing.assert_allclose(
+        pd.DataFrame(result, index=columns, columns=columns).loc[
+            numbers, numbers].values,
+        frame[numbers].corr().abs().values, rtol=1e-9, atol=1e-12)
+    for a, b in [('patient.sex', 'stents.stent.type'),
+                 ('hospitalization.diagnosis', 'stents.stenosisType')]:
+        i, j = columns.index(a), columns.index(b)
+        assert result[i, j] == pytest.approx(
+            cramers_v(frame[a], frame[b]), rel=1e-9)
+        assert result[i, j] == result[j, i]
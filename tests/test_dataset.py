@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+import dataset
+from dataset import load_stents, read_cache
+
+
+PATH = './in/st.csv'
+
+
+def head(path, lines):
+    with open(PATH, encoding='UTF-8') as f:
+        rows = [line for i, line in zip(range(lines), f)]
+    with open(path, 'w', encoding='UTF-8') as f:
+        f.writelines(rows)
+
+
+def test_cache_follows_export_and_schema(tmp_path, monkeypatch):
+    path = str(tmp_path / 'st.csv')
+    cache_dir = str(tmp_path / 'cache')
+    head(path, 100)
+    rows = len(load_stents(path, cache_dir=cache_dir))
+    first = os.listdir(cache_dir)
+    assert len(load_stents(path, cache_dir=cache_dir)) == rows
+    assert os.listdir(cache_dir) == first
+
+    # a newer export replaces the cache of the old one
+    head(path, 200)
+    assert len(load_stents(path, cache_dir=cache_dir)) > rows
+    second = os.listdir(cache_dir)
+    assert len(second) == 1 and second != first
+
+    # so does a new cache format
+    monkeypatch.setattr(dataset, 'CACHE_VERSION', dataset.CACHE_VERSION + 1)
+    load_stents(path, cache_dir=cache_dir)
+    third = os.listdir(cache_dir)
+    assert len(third) == 1 and third != second
+
+    with pytest.raises(KeyError):
+        read_cache(os.path.join(cache_dir, third[0]), ['patient.name'])
@@ -0,0 +1,160 @@
+import csv
+import datetime
+import importlib
+import time
+
+import numpy as np
+import pytest
+
+from conftest import counts
+from dataset import load_stents
+from pushdown import pushdown_aggregate
+from schema import DTYPES
+from tasks import compute, new_run
+
+mongomock = pytest.importorskip('mongomock')
+export = importlib.import_module('import')
+
+
+PATH = './in/st.csv'
+FIELDS = './in/fields.txt'
+CARDS = 60
+
+
+def typed(name, value):
+    if (DTYPES[name].startswith('int')):
+        return int(float(value))
+    if (DTYPES[name].startswith('float')):
+        return float(value)
+    return value
+
+
+def put(doc, name, value):
+    *parents, key = name.split('.')
+    for parent in parents:
+        doc = doc.setdefault(parent, {})
+    doc[key] = value
+
+
+def read_rows(path):
+    with open(path, encoding='UTF-8', newline='') as f:
+        reader = csv.reader(f)
+        return next(reader), sorted(reader)
+
+
+def csv_cards():
+    # the first CARDS cards of the export, nested back the way they are
+    # stored, with createdAt in milliseconds
+    with open(PATH, encoding='UTF-8', newline='') as f:
+        reader = csv.DictReader(f)
+        cards = {}
+        for row in reader:
+            if (row['patient_id'] not in cards):
+                if (len(cards) == CARDS):
+                    break
+                day = datetime.datetime.strptime(row['createdAt'],
+                                                 '%d.%m.%Y')
+                created = int(time.mktime(day.timetuple())) * 1000
+                cards[row['patient_id']] = {
+                    '_id': row['patient_id'], 'createdAt': created,
+                    'updatedAt': created, 'stents': []}
+                for name, value in row.items():
+                    if (value != '' and not name.startswith('stents.') and
+                            name not in ('_id', 'patient_id', 'createdAt')):
+                        put(cards[row['patient_id']], name,
+                            typed(name, value))
+            stent = {}
+            for name, value in row.items():
+                if (value != '' and name.startswith('stents.')):
+                    put(stent, name[len('stents.'):], typed(name, value))
+            cards[row['patient_id']]['stents'].append(stent)
+    return list(cards.values())
+
+
+@pytest.fixture
+def cards():
+    collection = mongomock.MongoClient().stents.cards
+    collection.insert_many(csv_cards())
+    return collection
+
+
+def test_stream_export(cards, tmp_path):
+    path = str(tmp_path / 'st.csv')
+    rows = export.stream_export(cards, path, FIELDS)
+
+    header, exported = read_rows(path)
+    expected_header, expected = read_rows(PATH)
+    ids = set(card['_id'] for card in cards.find())
+    expected = [row for row in expected if row[1] in ids]
+    assert header == expected_header
+    assert rows == len(exported)
+    assert exported == expected
+
+
+def test_incremental_export(cards, tmp_path):
+    path = str(tmp_path / 'st.csv')
+    full = str(tmp_path / 'full.csv')
+    docs = list(cards.find(sort=[('createdAt', 1), ('_id', 1)]))
+    last = docs.pop()
+    cards.delete_one({'_id': last['_id']})
+    export.incremental_export(cards, path, FIELDS)
+
+    def assert_same():
+        export.stream_export(cards, full, FIELDS)
+        assert read_rows(path) == read_rows(full)
+
+    # a new card is appended
+    cards.insert_one(last)
+    export.incremental_export(cards, path, FIELDS)
+    assert_same()
+
+    # an edited card replaces its rows
+    edited = docs[0]
+    edited['stents'][0]['stent']['type'] = 'edited'
+    edited['updatedAt'] = last['createdAt'] + 1
+    cards.replace_one({'_id': edited['_id']}, edited)
+    export.incremental_export(cards, path, FIELDS)
+    assert_same()
+
+    # a card without stents leaves no rows behind
+    emptied = docs[1]
+    emptied['stents'] = []
+    emptied['updatedAt'] = last['createdAt'] + 2
+    cards.replace_one({'_id': emptied['_id']}, emptied)
+    export.incremental_export(cards, path, FIELDS)
+    assert_same()
+    assert emptied['_id'] not in [row[1] for row in read_rows(path)[1]]
+    assert export.load_watermark(path)['updatedAt'] == emptied['updatedAt']
+
+
+def test_incremental_export_after_empty_export(cards, tmp_path):
+    path = str(tmp_path / 'st.csv')
+    full = str(tmp_path / 'full.csv')
+    docs = list(cards.find())
+    cards.delete_many({})
+    export.incremental_export(cards, path, FIELDS)
+    assert export.load_watermark(path) == {}
+
+    cards.insert_many(docs)
+    export.incremental_export(cards, path, FIELDS)
+    export.stream_export(cards, full, FIELDS)
+    assert read_rows(path) == read_rows(full)
+    assert 'createdAt' in export.load_watermark(path)
+
+
+def test_pushdown_aggregate(cards, tmp_path):
+    path = str(tmp_path / 'st.csv')
+    export.stream_export(cards, path, FIELDS)
+    run = new_run(path, None, {'stents': load_stents(
+        path, cache_dir=str(tmp_path / 'cache'))})
+
+    known = pushdown_aggregate(cards)
+    for node in ('stents_cube', 'people_cube'):
+        cube = compute(run, node)
+        assert known[node]['dims'] == cube['dims']
+        for dim in cube['dims']:
+            assert counts(known[node], dim) == counts(cube, dim), dim
+    mean_age = compute(run, 'mean_age')
+    assert list(map(str, known['mean_age'].index)) == \
+        list(map(str, mean_age.index))
+    assert np.allclose(known['mean_age'].values, mean_age.values)
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from outputs import WORKBOOK, new_outputs, write_tables
+
+
+TABLES = [
+    ('task1', pd.Series([1200, 866, 3], index=[u'муж.', u'жен.', u'?'])),
+    ('task3b', pd.DataFrame({u'жен.': [2.0, np.nan, 4.0],
+                             u'муж.': [5.0, 1.0, 0.0]},
+                            index=pd.Index(['x', 'y', 'z'],
+                                           name='hospitalization.diagnosis'),
+                            columns=[u'жен.', u'муж.'])),
+]
+
+
+@pytest.mark.parametrize('constant_memory', [False, True])
+def test_workbook_reads_back(tmp_path, constant_memory):
+    outputs = new_outputs(['xlsx'], engine='xlsxwriter',
+                          constant_memory=constant_memory)
+    write_tables(TABLES, outputs, str(tmp_path))
+    for sheet, frame in TABLES:
+        expected = pd.DataFrame(frame)
+        back = pd.read_excel(str(tmp_path / WORKBOOK), sheet_name=sheet,
+                             index_col=0)
+        assert list(map(str, back.index)) == list(map(str, expected.index))
+        assert (list(map(str, back.columns)) ==
+                list(map(str, expected.columns)))
+        np.testing.assert_allclose(back.values.astype(np.float64),
+                                   expected.values.astype(np.float64))
@@ -0,0 +1,26 @@
+import os
+
+from dataset import load_stents
+from outputs import new_outputs
+from partition import partition_dir, run_partition, split
+from schema import columns_for
+
+
+PATH = './in/st.csv'
+
+
+def test_every_clinic_is_drawn(tmp_path):
+    # the export has clinics with a single patient of a single sex
+    stents = load_stents(PATH, columns_for() + ['clinic'],
+                         cache_dir=str(tmp_path / 'cache'))
+    outputs = new_outputs(['png', 'xlsx'], dpi={'png': 10})
+    out_dir = str(tmp_path / 'out')
+    keys = []
+    for key, part in split(stents, 'clinic'):
+        job = (PATH, None, 'clinic', key, part, False, outputs, out_dir)
+        done, records, error = run_partition(job)
+        assert error is None, '%s\n%s' % (key, error)
+        keys.append(key)
+        assert os.path.exists(os.path.join(
+            partition_dir('clinic', key, out_dir), 'report.xlsx'))
+    assert len(keys) == stents['clinic'].nunique()
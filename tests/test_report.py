@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import report
+
+
+INDEX = ['a', 'b', 'c', 'd']
+FRAMES = [
+    (pd.Series([40, 3, 12, 0], index=INDEX), False),
+    (pd.DataFrame({'x': [40, 3, 12, 7], 'y': [2, 30, 0, 9]}, index=INDEX,
+                  columns=['x', 'y']), True),
+    (pd.DataFrame({'x': [40, 3, 12, 7], 'y': [2, 30, 0, 9],
+                   'z': [5, 5, 1, 60]}, index=INDEX,
+                  columns=['x', 'y', 'z']), False),
+]
+
+
+@pytest.mark.parametrize('frame, stacked', FRAMES)
+def test_bar_labels_follow_the_bars(frame, stacked):
+    report.setup_matplotlib()
+    fig = report.plt.figure()
+    ax = fig.add_subplot(111)
+    frame.plot(kind='barh', ax=ax, stacked=stacked, legend=False)
+    # pandas adds the bars column by column
+    patches = ax.patches
+    widths = np.array([p.get_width() for p in patches])
+    ends = np.array([p.get_x() + p.get_width() for p in patches])
+    centers = np.array([p.get_y() + p.get_height() / 2.0 for p in patches])
+    report.plt.close(fig)
+
+    inside = widths >= 5
+    shown = inside | (not stacked)
+    x, y, values, labels_inside = report.bar_labels(frame, stacked, 5)
+    np.testing.assert_allclose(values, widths[shown])
+    np.testing.assert_array_equal(labels_inside, inside[shown])
+    np.testing.assert_allclose(y, centers[shown], atol=1e-9)
+    np.testing.assert_allclose(
+        x, np.where(inside, 0.98 * ends, ends + 1)[shown], atol=1e-9)
@@ -0,0 +1,119 @@
+import asyncio
+import functools
+import json
+from urllib.parse import quote
+
+import pytest
+
+import service
+from dataset import load_stents
+
+
+PATH = './in/st.csv'
+
+
+class Writer(object):
+
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def request(app, line):
+    async def send():
+        reader = asyncio.StreamReader()
+        reader.feed_data(line.encode('latin-1') + b'\r\n\r\n')
+        reader.feed_eof()
+        await app.handle(reader, writer)
+    writer = Writer()
+    asyncio.run(send())
+    head, _, body = writer.data.partition(b'\r\n\r\n')
+    return int(head.split()[1]), body
+
+
+@pytest.fixture(scope='module')
+def app(repo_dir, tmp_path_factory):
+    cache_dir = str(tmp_path_factory.mktemp('cache'))
+    patch = pytest.MonkeyPatch()
+    patch.setattr(service, 'load_stents',
+                  functools.partial(load_stents, cache_dir=cache_dir))
+    yield service.Service(PATH, 1 << 20)
+    patch.undo()
+
+
+def test_lru_cache():
+    cache = service.LRUCache(10)
+    cache.put('a', 'xxxx')
+    cache.put('b', 'xxxx')
+    assert cache.get('a') == 'xxxx'
+    # b is the least recently used one now
+    cache.put('c', 'xxxx')
+    assert cache.get('b') is None
+    assert sorted(cache.items) == ['a', 'c']
+    assert cache.total == 8
+    # too large to be kept at all
+    cache.put('d', 'x' * 11)
+    assert cache.get('d') is None
+    assert cache.total == 8
+
+
+def test_filters(app):
+    stents = app.state['stents']
+    clinic = stents['clinic'].value_counts().index[0]
+    status, body = request(app, 'GET /task/1.json?clinic=%s' %
+                           quote(clinic))
+    assert status == 200
+    people = stents[stents['clinic'] == clinic].index.unique()
+    assert sum(json.loads(body.decode('UTF-8')).values()) == len(people)
+    # the filtered run is kept for the next task
+    assert app.state['runs'].get((('clinic', clinic),)) is not None
+
+    # clinics where every patient has the same sex
+    pairs = stents[['clinic', 'patient.sex']].dropna().drop_duplicates()
+    sexes = pairs['clinic'].value_counts()
+    for clinic in sexes[sexes == 1].index[:2]:
+        assert request(app, 'GET /task/2.json?clinic=%s' %
+                       quote(clinic))[0] == 200
+
+    status, body = request(app, 'GET /task/1.json?from=2100-01-01')
+    assert status == 404
+    assert body == b'no stents match the filters\n'
+
+
+@pytest.mark.parametrize('line, status', [
+    ('GET /task/1.json?nope=1', 400),
+    ('GET /task/1.json?from=yesterday', 400),
+    ('GET', 400),
+    ('GET /task/99.json', 404),
+    ('GET /task/13.png', 404),
+    ('GET /reload', 405),
+])
+def test_status(app, line, status):
+    assert request(app, line)[0] == status
+
+
+def test_server_errors_are_500(app, monkeypatch):
+    def broken(*args):
+        raise ValueError('broken')
+    monkeypatch.setattr(service, 'produce', broken)
+    assert request(app, 'GET /task/3a.json?clinic=x')[0] == 500
+
+
+def test_reload(app):
+    request(app, 'GET /task/2.json')
+    assert len(app.cache.items)
+    state = app.state
+    status, body = request(app, 'POST /reload?input=%s' % PATH)
+    assert status == 200
+    assert json.loads(body.decode('UTF-8')) == {
+        'input': PATH, 'rows': len(state['stents'])}
+    assert app.state is not state
+    assert not app.cache.items
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from significance import significance_tables
+from tasks import new_run
+
+
+PATH = './in/st.csv'
+RESAMPLES = 1200
+
+
+def test_tables_do_not_depend_on_workers(stents):
+    run = new_run(PATH, None, {'stents': stents})
+    one = significance_tables(run, RESAMPLES, seed=3, workers=1)
+    two = significance_tables(run, RESAMPLES, seed=3, workers=2)
+    assert [name for name, table in one] == [name for name, table in two]
+    for (name, a), (_, b) in zip(one, two):
+        pd.testing.assert_frame_equal(a, b, check_exact=True, obj=name)
+
+
+def test_pvalues_are_symmetric(stents):
+    run = new_run(PATH, ['8', '13'], {'stents': stents})
+    tables = dict(significance_tables(run, RESAMPLES, seed=0))
+    for name in ('task8_p', 'task13_p'):
+        p = tables[name].values
+        np.testing.assert_array_equal(p, p.T)
+        assert np.isnan(np.diag(p)).all()
+        observed = p[~np.isnan(p)]
+        assert ((observed > 0) & (observed <= 1)).all()
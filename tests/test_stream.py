@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from conftest import counts
+from dataset import load_stents, read_chunks
+from stream import stream_aggregate
+from tasks import compute, new_run
+
+
+PATH = './in/st.csv'
+
+
+@pytest.fixture(scope='module')
+def in_memory(tmp_path_factory):
+    cache_dir = str(tmp_path_factory.mktemp('cache'))
+    stents = load_stents(PATH, cache_dir=cache_dir)
+    return new_run(PATH, None, {'stents': stents})
+
+
+def assert_same_cube(a, b):
+    assert a['dims'] == b['dims']
+    for dim in a['dims']:
+        assert counts(a, dim) == counts(b, dim), dim
+        if (dim != 'patient.sex'):
+            assert (counts(a, [dim, 'patient.sex']) ==
+                    counts(b, [dim, 'patient.sex'])), dim
+
+
+@pytest.mark.parametrize('chunksize', [97, 500, 100000])
+def test_stream_matches_in_memory(in_memory, chunksize):
+    streamed = stream_aggregate(read_chunks(PATH, chunksize=chunksize))
+
+    assert_same_cube(streamed['stents_cube'],
+                     compute(in_memory, 'stents_cube'))
+    assert_same_cube(streamed['people_cube'],
+                     compute(in_memory, 'people_cube'))
+
+    expected = compute(in_memory, 'mean_age').dropna()
+    mean_age = streamed['mean_age'].dropna()
+    assert list(map(str, mean_age.index)) == list(map(str, expected.index))
+    np.testing.assert_allclose(mean_age.values, expected.values)
+
+    np.testing.assert_allclose(streamed['stent_size'],
+                               compute(in_memory, 'stent_size'),
+                               rtol=1e-6)
+
+    expected = compute(in_memory, 'correlations')
+    correlations = streamed['correlations']
+    # both hold the same columns, task_matrix() looks them up by name
+    assert sorted(correlations['columns']) == sorted(expected['columns'])
+    order = [expected['columns'].index(c) for c in correlations['columns']]
+    for kind in ('corr', 'assoc'):
+        np.testing.assert_allclose(correlations[kind],
+                                   expected[kind][np.ix_(order, order)],
+                                   rtol=1e-9, atol=1e-12, equal_nan=True,
+                                   err_msg=kind)
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from outputs import WORKBOOK, new_outputs
+from tasks import TASKS, new_run, run_tasks
+
+
+PATH = './in/st.csv'
+
+
+def test_run_tasks_writes_every_table(stents, tmp_path):
+    run = new_run(PATH, None, {'stents': stents})
+    run_tasks(run, out_dir=str(tmp_path), outputs=new_outputs(['xlsx']))
+
+    sheets = pd.read_excel(str(tmp_path / WORKBOOK), sheet_name=None,
+                           index_col=0)
+    expected = []
+    for task in TASKS:
+        expected.append('task' + task['name'])
+        if (task['kind'] == 'corr'):
+            expected.append('task' + task['name'] + '_assoc')
+    assert list(sheets) == expected
+    for sheet, frame in sheets.items():
+        assert len(frame), sheet
+    # one count per patient and per sex, largest first
+    counts = sheets['task1'].iloc[:, 0]
+    assert counts.sum() == stents.index.nunique()
+    assert list(counts) == sorted(counts, reverse=True)
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+from artifacts import OUT_DIR
+from cube import PEOPLE_DIMS, STENT_DIMS, build_cube, cube_counts, \
+    merge_cubes
+from dataset import load_stents, read_chunks
+from instrument import stage
+from outputs import OUTPUTS, write_tables
+from schema import columns_for
+from stream import merge_counts
+from tasks import select_tasks
+
+
+# Counts of the count tasks per month or quarter, and the length of
+# stay. Aggregates are kept per period and merged chunk by chunk, the
+# same way stream.py merges its cubes, so that more history only adds
+# cells. Rolling windows are differences of prefix sums over the
+# periods, so that a longer window costs no extra pass over the data.
+
+FREQS = {'month': 1, 'quarter': 3}
+PERIOD = 'period'
+DATES = ['createdAt', 'hospitalization.startedAt']
+STAY = ['hospitalization.startedAt', 'hospitalization.finishedAt']
+TREND_KINDS = ('counts', 'basic', 'stacked')
+TREND_WORKBOOK = 'trend.xlsx'
+
+
+def periods(dates, freq='month'):
+    # months or quarters since 1970, NaN for a missing date
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    keys = (months // FREQS[freq]).astype(np.float64)
+    keys[pd.isnull(dates)] = np.nan
+    return keys
+
+
+def period_label(key, freq='month'):
+    key = int(key)
+    if (freq == 'quarter'):
+        return '%04dQ%d' % (1970 + key // 4, key % 4 + 1)
+    return '%04d-%02d' % (1970 + key // 12, key % 12 + 1)
+
+
+def stay_days(people):
+    # length of stay in days, NaN when a date is missing
+    stay = (np.asarray(people[STAY[1]], dtype='datetime64[ns]') -
+            np.asarray(people[STAY[0]], dtype='datetime64[ns]'))
+    return stay / np.timedelta64(1, 'D')
+
+
+def new_trend(date='hospitalization.startedAt', freq='month'):
+    return {'date': date, 'freq': freq,
+            'stents_cube': None, 'people_cube': None, 'stay': None,
+            'seen': set()}
+
+
+def update_trend(trend, chunk):
+    frame = chunk.copy()
+    frame[PERIOD] = periods(frame[trend['date']], trend['freq'])
+    dims = [PERIOD] + [dim for dim in STENT_DIMS if dim in frame.columns]
+    trend['stents_cube'] = merge_cubes(trend['stents_cube'],
+                                       build_cube(frame, dims))
+
+    # first seen row of every patient
+    people = frame.groupby(level=0).first()
+    people = people[np.array([p not in trend['seen']
+                              for p in people.index], dtype=bool)]
+    trend['seen'].update(people.index)
+    dims = [PERIOD] + [dim for dim in PEOPLE_DIMS if dim in people.columns]
+    trend['people_cube'] = merge_cubes(trend['people_cube'],
+                                       build_cube(people, dims))
+    stay = pd.DataFrame({PERIOD: people[PERIOD].values,
+                         'days': stay_days(people)}).dropna()
+    trend['stay'] = merge_counts(trend['stay'], stay.groupby(PERIOD)[
+        'days'].agg(['sum', 'count']))
+    return trend
+
+
+def rolling(table, window=None):
+    # sums over the last window periods; rows must cover every period
+    if (not window or window <= 1):
+        return table
+    sums = np.cumsum(np.asarray(table, dtype=np.float64), axis=0)
+    sums[window:] = sums[window:] - sums[:-window]
+    return pd.DataFrame(sums, index=table.index, columns=table.columns)
+
+
+def by_period(table, trend, window=None):
+    # every period between the first and the last one, labelled
+    if (not len(table)):
+        return table
+    keys = np.asarray(table.index, dtype=np.float64)
+    full = np.arange(keys.min(), keys.max() + 1)
+    table = rolling(table.reindex(full).fillna(0), window)
+    table.index = pd.Index([period_label(key, trend['freq'])
+                            for key in full], name=PERIOD)
+    return table
+
+
+def trend_table(trend, task, window=None):
+    dims = task.get('column') or task['groupby']
+    if (isinstance(dims, str)):
+        dims = [dims]
+    counts = cube_counts(trend[task['inputs'][0]], [PERIOD] + list(dims))
+    if (not len(counts)):
+        return pd.DataFrame()
+    table = counts.unstack(list(range(1, len(dims) + 1))).fillna(0)
+    return by_period(table, trend, window)
+
+
+def stay_table(trend, window=None):
+    if (trend['stay'] is None):
+        return pd.DataFrame()
+    table = by_period(trend['stay'][['sum', 'count']], trend, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = table['sum'] / table['count']
+    return pd.DataFrame({'patients': table['count'], 'mean_days': mean},
+                        columns=['patients', 'mean_days'])
+
+
+def trend_aggregate(chunks, date='hospitalization.startedAt',
+                    freq='month'):
+    trend = new_trend(date, freq)
+    for chunk in chunks:
+        with stage('trend', rows_in=len(chunk)):
+            update_trend(trend, chunk)
+    return trend
+
+
+def run_trend(path='./in/st.csv', names=None, freq='month',
+              date='hospitalization.startedAt', window=None,
+              chunksize=None, outputs=OUTPUTS, out_dir=OUT_DIR):
+    # trend_<task> tables of the selected count tasks and trend_stay,
+    # in their own workbook
+    tasks = [task for task in select_tasks(names)
+             if task['kind'] in TREND_KINDS]
+    columns = columns_for([task['name'] for task in tasks])
+    for name in [date] + STAY:
+        if (name not in columns):
+            columns.append(name)
+    if (chunksize):
+        chunks = read_chunks(path, columns, chunksize)
+    else:
+        chunks = [load_stents(path, columns, verbose=True)]
+    trend = trend_aggregate(chunks, date, freq)
+
+    tables = [('trend_' + task['chart']['filename'],
+               trend_table(trend, task, window)) for task in tasks]
+    tables.append(('trend_stay', stay_table(trend, window)))
+    write_tables(tables, outputs, out_dir, TREND_WORKBOOK)